@@ -13,13 +13,21 @@ Steps
    - /content/WEIGHT_filtered.csv
 3) Drop all hadm_id columns (any case, including suffixed variants).
 4) Recode Sex: M -> 1, F -> 0 (nullable Int64).
-5) Save to /content/subject_level_merged_firstICU.csv
+5) Save to /content/subject_level_merged_firstICU.csv (plus a .parquet sibling)
+
+Inputs are read from their .parquet siblings when an upstream script wrote one, and
+the run is skipped when the outputs are newer than every input.
 """
 
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from functools import reduce
-from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# "string" dtype is backed by Arrow buffers, so .str ops run as Arrow kernels
+pd.set_option("mode.string_storage", "pyarrow")
 
 # ------------------------- I/O paths -------------------------
 ICU_PATH   = Path("/content/icustays_mimic_IV.csv")
@@ -28,15 +36,60 @@ ADM_PATH    = Path("/content/admissions_subject_hadm_death.csv")
 PAT_PATH    = Path("/content/patients_subject_sex_age.csv")
 WT_PATH     = Path("/content/WEIGHT_filtered.csv")
 OUT_PATH    = Path("/content/subject_level_merged_firstICU.csv")
+OUT_PQ      = OUT_PATH.with_suffix(".parquet")
+
+TIME_FMT = "%Y-%m-%d %H:%M:%S"  # MIMIC-IV timestamp layout
+
+SEX_M = pa.array(["m", "male"])
+SEX_F = pa.array(["f", "female"])
 
 # ------------------------- Helpers -------------------------
-def normalize_id_series(s: pd.Series) -> pd.Series:
-    """Normalize ID as string; trim whitespace and trailing '.0'."""
-    return (
-        s.astype("string")
-         .str.strip()
-         .str.replace(r"\.0$", "", regex=True)
-    )
+def outputs_fresh(inputs, outputs) -> bool:
+    """True if every output exists and is newer than every input."""
+    if not all(p.exists() for p in outputs):
+        return False
+    return min(p.stat().st_mtime for p in outputs) > max(p.stat().st_mtime for p in inputs)
+
+def source_of(path: Path) -> Path:
+    """
+    The file read_any will load: the .parquet sibling only when it is newer than the CSV
+    (same test as outputs_fresh); a stale or missing sibling falls back to the CSV.
+    """
+    pq = path.with_suffix(".parquet")
+    if not path.exists():
+        return pq if pq.exists() else path
+    return pq if outputs_fresh([path], [pq]) else path
+
+def read_any(path: Path) -> pd.DataFrame:
+    """Read a CSV, or its typed .parquet sibling from the upstream script when that is up to date."""
+    src = source_of(path)
+    return pd.read_parquet(src) if src.suffix == ".parquet" else pd.read_csv(src)
+
+def normalize_id_series(s: pd.Series, source: str = "") -> pd.Series:
+    """
+    Normalize IDs to Int32, the one key type shared by every frame (all MIMIC IDs fit).
+    '123', '123.0' and ' 123 ' convert; blanks become <NA>; any other value raises, so a
+    bad file fails loudly instead of silently matching nothing in the joins.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        txt, num = s, s
+    else:
+        txt = s.astype("string").str.strip().replace("", pd.NA)
+        num = pd.to_numeric(txt, errors="coerce")
+    bad = txt.notna() & (num.isna() | (num % 1 != 0))
+    if bad.any():
+        raise ValueError(
+            f"{source}: {int(bad.sum())} subject_id value(s) are not integer IDs, "
+            f"e.g. {txt[bad].unique()[:5].tolist()}"
+        )
+    return num.astype("Int32")
+
+def col_index(df: pd.DataFrame) -> dict:
+    """Lowercase column name -> actual column name (first occurrence wins)."""
+    index = {}
+    for c in df.columns:
+        index.setdefault(c.lower(), c)
+    return index
 
 def drop_hadm_id_cols(df: pd.DataFrame) -> pd.DataFrame:
     """Drop any columns that look like hadm_id (case-insensitive, including suffixed variants)."""
@@ -47,15 +100,15 @@ def drop_hadm_id_cols(df: pd.DataFrame) -> pd.DataFrame:
 
 def read_with_subject(path: Path) -> pd.DataFrame:
     """Read CSV; ensure subject_id exists and normalized; drop hadm_id-like columns."""
-    df = pd.read_csv(path)
+    df = read_any(path)
     # normalize subject_id
     if "subject_id" not in df.columns:
-        # try common alternatives (fail with clear error if not found)
-        candidates = [c for c in df.columns if c.lower() == "subject_id"]
-        if not candidates:
+        # case-insensitive fallback (fail with clear error if not found)
+        actual = col_index(df).get("subject_id")
+        if actual is None:
             raise KeyError(f"{path} is missing required column 'subject_id'. Columns found: {list(df.columns)}")
-        df.rename(columns={candidates[0]: "subject_id"}, inplace=True)
-    df["subject_id"] = normalize_id_series(df["subject_id"])
+        df.rename(columns={actual: "subject_id"}, inplace=True)
+    df["subject_id"] = normalize_id_series(df["subject_id"], source=str(path))
     # drop hadm_id variants
     df = drop_hadm_id_cols(df)
     return df
@@ -65,14 +118,15 @@ def first_icu_per_subject(icu_path: Path) -> pd.DataFrame:
     From icustays, keep the earliest 'intime' per subject.
     Returns a DataFrame with unique subject_id (and keeps 'intime' as the first ICU intime).
     """
-    icu = pd.read_csv(icu_path)
+    icu = read_any(icu_path)
     # normalize subject_id
     if "subject_id" not in icu.columns:
-        candidates = [c for c in icu.columns if c.lower() == "subject_id"]
-        if not candidates:
-            raise KeyError(f"{icu_path} is missing 'subject_id'. Columns: {list(icu.columns)}")
-        icu.rename(columns={candidates[0]: "subject_id"}, inplace=True)
-    icu["subject_id"] = normalize_id_series(icu["subject_id"])
+        # case-insensitive fallback (fail with clear error if not found)
+        actual = col_index(icu).get("subject_id")
+        if actual is None:
+            raise KeyError(f"{icu_path} is missing required column 'subject_id'. Columns found: {list(icu.columns)}")
+        icu.rename(columns={actual: "subject_id"}, inplace=True)
+    icu["subject_id"] = normalize_id_series(icu["subject_id"], source=str(icu_path))
 
     # pick an 'intime' column (allow a few common variants)
     intime_col = None
@@ -83,13 +137,13 @@ def first_icu_per_subject(icu_path: Path) -> pd.DataFrame:
     if intime_col is None:
         raise KeyError(f"{icu_path} is missing an ICU admission time column (expected one of: 'intime', 'icu_intime').")
 
-    icu[intime_col] = pd.to_datetime(icu[intime_col], errors="coerce")
-    # sort by subject then intime asc; NaT go last to avoid being picked as earliest
-    icu = icu.sort_values(["subject_id", intime_col], ascending=[True, True], na_position="last")
-    # keep first ICU stay per subject
-    first_icu = icu.drop_duplicates(subset=["subject_id"], keep="first").copy()
+    icu[intime_col] = pd.to_datetime(icu[intime_col], format=TIME_FMT, errors="coerce", cache=True)
+    # earliest intime per subject without a full sort; NaT ranks last so it is only
+    # picked when a subject has no valid intime (ties keep the first row)
+    rank_time = icu[intime_col].fillna(pd.Timestamp.max)
+    idx = rank_time.groupby(icu["subject_id"], dropna=False).idxmin()
     # slim to subject_id + earliest intime (optional)
-    first_icu = first_icu[["subject_id", intime_col]].rename(columns={intime_col: "first_icu_intime"})
+    first_icu = icu.loc[idx.to_numpy(), ["subject_id", intime_col]].rename(columns={intime_col: "first_icu_intime"})
     return first_icu
 
 def is_binary_01(s: pd.Series) -> bool:
@@ -109,26 +163,40 @@ def dedupe_by_subject(df: pd.DataFrame) -> pd.DataFrame:
     Reduce to one row per subject_id:
       - For binary 0/1 columns -> max (any 1 => 1)
       - For others -> first non-null
+    Columns are classified once on the whole frame, then reduced in a single groupby.
     """
     if df.empty:
         return df
-    def _agg_group(g: pd.DataFrame) -> pd.Series:
-        out = {}
-        for c in g.columns:
-            if c == "subject_id":
-                continue
-            s = g[c]
-            if is_binary_01(s):
-                out[c] = s.max()
-            else:
-                out[c] = s.dropna().iloc[0] if s.notna().any() else np.nan
-        return pd.Series(out)
-    rows = []
-    for sid, grp in df.groupby("subject_id", dropna=False):
-        row = _agg_group(grp)
-        row["subject_id"] = sid
-        rows.append(row)
-    return pd.DataFrame(rows)
+    agg_map = {
+        c: ("max" if is_binary_01(df[c]) else "first")
+        for c in df.columns if c != "subject_id"
+    }
+    if not agg_map:
+        return df[["subject_id"]].drop_duplicates()
+    out = df.groupby("subject_id", dropna=False).agg(agg_map).reset_index()
+    # 0/1 flags fit in int8 (float32 when NaN is present)
+    for c, how in agg_map.items():
+        if how == "max":
+            out[c] = pd.to_numeric(out[c], downcast="integer" if pd.api.types.is_integer_dtype(out[c]) else "float")
+    return out
+
+def subject_index(df: pd.DataFrame) -> pd.DataFrame:
+    """Index by the (already normalized) subject_id."""
+    return df.set_index("subject_id")
+
+def join_on_subject(base: pd.DataFrame, others: list) -> pd.DataFrame:
+    """
+    Left-join per-subject frames (unique subject_id) onto base in one indexed join.
+    Overlapping column names fall back to pairwise joins with merge's _x/_y suffixes.
+    """
+    left = subject_index(base)
+    others = [subject_index(o) for o in others]
+    names = list(left.columns) + [c for o in others for c in o.columns]
+    if len(names) == len(set(names)):
+        return left.join(others, how="left").reset_index()
+    for o in others:
+        left = left.join(o, how="left", lsuffix="_x", rsuffix="_y")
+    return left.reset_index()
 
 def recode_and_collapse_sex(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -140,16 +208,18 @@ def recode_and_collapse_sex(df: pd.DataFrame) -> pd.DataFrame:
     sex_like = [c for c in df.columns if c.lower().startswith("sex")]
     if not sex_like:
         return df
-    # normalize each Sex-like col
+    # normalize each Sex-like col (set-membership on Arrow strings instead of a per-element dict map)
     for c in sex_like:
         if not pd.api.types.is_numeric_dtype(df[c]):
-            s = df[c].astype("string").str.strip().str.lower()
-            df[c] = s.map({"m": 1, "male": 1, "f": 0, "female": 0})
+            arr = pc.utf8_lower(pc.utf8_trim_whitespace(pa.array(df[c].astype("string"))))
+            is_m = pc.is_in(arr, value_set=SEX_M).to_numpy(zero_copy_only=False)
+            is_f = pc.is_in(arr, value_set=SEX_F).to_numpy(zero_copy_only=False)
+            df[c] = np.where(is_m, 1.0, np.where(is_f, 0.0, np.nan))
         df[c] = df[c].astype("Int64")
 
     # collapse into a single 'Sex' via row-wise max (any 1 => 1; 0 if only 0/NA)
-    sex_df = pd.concat([df[c] for c in sex_like], axis=1)
-    df["Sex"] = sex_df.max(axis=1, skipna=True).astype("Int64")
+    sex_arr = df[sex_like].to_numpy(dtype="float64", na_value=np.nan)
+    df["Sex"] = pd.array(np.fmax.reduce(sex_arr, axis=1), dtype="Int64")
 
     # drop redundant Sex-like columns except the final 'Sex'
     to_drop = [c for c in sex_like if c != "Sex"]
@@ -159,6 +229,12 @@ def recode_and_collapse_sex(df: pd.DataFrame) -> pd.DataFrame:
 
 # ------------------------- Main -------------------------
 if __name__ == "__main__":
+    # 0) Re-runs on unchanged inputs are a no-op
+    inputs = [source_of(p) for p in (ICU_PATH, COMORB_PATH, ADM_PATH, PAT_PATH, WT_PATH)]
+    if outputs_fresh(inputs, [OUT_PATH, OUT_PQ]):
+        print(f"Up to date (cache hit): {OUT_PATH}")
+        raise SystemExit(0)
+
     # 1) Subjects with first ICU stay
     first_icu = first_icu_per_subject(ICU_PATH)  # columns: subject_id, first_icu_intime
     subjects = set(first_icu["subject_id"])
@@ -181,8 +257,7 @@ if __name__ == "__main__":
     wt = dedupe_by_subject(wt)
 
     # 3) Merge (left-join) onto the subject list from first ICU
-    dfs_to_merge = [first_icu, comorb, adm, pat, wt]
-    merged = reduce(lambda l, r: pd.merge(l, r, on="subject_id", how="left"), dfs_to_merge)
+    merged = join_on_subject(first_icu, [comorb, adm, pat, wt])
 
     # 4) Drop any hadm_id columns that may have slipped in
     merged = drop_hadm_id_cols(merged)
@@ -193,7 +268,12 @@ if __name__ == "__main__":
     # 6) Put ID first; save
     cols = ["subject_id"] + [c for c in merged.columns if c != "subject_id"]
     merged = merged[cols]
-    merged.to_csv(OUT_PATH, index=False)
+    # write to .tmp paths first, so a failed run never leaves a half-written CSV/Parquet pair
+    tmp_csv, tmp_pq = OUT_PATH.with_name(OUT_PATH.name + ".tmp"), OUT_PQ.with_name(OUT_PQ.name + ".tmp")
+    merged.to_csv(tmp_csv, index=False)
+    merged.to_parquet(tmp_pq, compression="snappy", index=False)
+    tmp_csv.replace(OUT_PATH)
+    tmp_pq.replace(OUT_PQ)
 
     print(f"Subjects in first ICU cohort: {len(subjects)}")
     print(f"Final rows: {len(merged)}")
@@ -4,16 +4,15 @@ from pathlib import Path
 # --- Config ---
 INPUT_PATH = Path("/content/PATIENTS.csv")
 
-def find_col(df: pd.DataFrame, target: str) -> str | None:
+def col_index(df: pd.DataFrame) -> dict:
     """
-    Return the actual column name in df that matches `target`
-    in a case/space-insensitive way, else None.
+    Map each column name, case/space-normalized, to the actual column name
+    (first occurrence wins). Build once per frame and look up with .get().
     """
-    t = target.strip().lower()
+    index = {}
     for c in df.columns:
-        if str(c).strip().lower() == t:
-            return c
-    return None
+        index.setdefault(str(c).strip().lower(), c)
+    return index
 
 def build_output_path(input_path: Path, suffix: str = "_mimic_III") -> Path:
     """
@@ -27,9 +26,10 @@ def main():
     df = pd.read_csv(INPUT_PATH)
 
     # Resolve required columns (case-insensitive)
-    col_subject = find_col(df, "SUBJECT_ID")
-    col_gender  = find_col(df, "GENDER")
-    col_age     = find_col(df, "AGE")
+    cols = col_index(df)
+    col_subject = cols.get("subject_id")
+    col_gender  = cols.get("gender")
+    col_age     = cols.get("age")
 
     missing = [name for name, col in {
         "SUBJECT_ID": col_subject,
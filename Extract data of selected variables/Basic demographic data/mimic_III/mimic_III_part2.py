@@ -5,85 +5,129 @@ Extract ITEMID 226512 from /content/filtered_by_ids/CHARTEVENTS.csv, keeping onl
 patients/admissions listed in /content/patient_ids_SUBJECT_HADM.csv. The output
 contains exactly four columns: SUBJECT_ID, HADM_ID, Weight (renamed from VALUE),
 and VALUEUOM. Values outside the physiologic range (<35 or >135) are set to NaN.
-The script streams the input in chunks for memory safety.
+The script streams the input as Arrow record batches (only the five needed
+columns are parsed) and writes all matches through a single CSV writer. Arrow's
+writer quotes the header and string fields ("kg"), prints whole floats without
+".0" (80, not 80.0), and Weight is float32 (about 7 significant digits).
 
-Output: /content/ITEMID226512_filtered.csv
+Output: /content/ITEMID226512_filtered.csv (plus a .parquet sibling; re-runs on
+unchanged inputs are skipped)
 """
 
 import os
-import numpy as np
+from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 # File paths
 base_path = "/content/patient_ids_SUBJECT_HADM.csv"
 target_path = "/content/filtered_by_ids/CHARTEVENTS.csv"
 output_path = "/content/ITEMID226512_filtered.csv"
+output_pq = str(Path(output_path).with_suffix(".parquet"))  # typed sibling of the CSV output
 
 ITEM_ID = 226512  # target ITEMID
+NUMERIC_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+# 0) Skip the scan when both outputs are newer than both inputs
+outputs = [Path(output_path), Path(output_pq)]
+if all(p.exists() for p in outputs) and min(p.stat().st_mtime for p in outputs) > max(
+    Path(p).stat().st_mtime for p in (base_path, target_path)
+):
+    print(f"Up to date (cache hit): {output_path}")
+    raise SystemExit(0)
 
 # 1) Read base file and collect allowed SUBJECT_ID / HADM_ID
 base = (
-    pd.read_csv(base_path, dtype={"SUBJECT_ID": "Int64", "HADM_ID": "Int64"})[
+    pd.read_csv(base_path, dtype={"SUBJECT_ID": "Int32", "HADM_ID": "Int32"})[
         ["SUBJECT_ID", "HADM_ID"]
     ]
     .drop_duplicates()
 )
-subjects = set(base["SUBJECT_ID"].dropna().astype(int))
-hadms = set(base["HADM_ID"].dropna().astype(int))
+subjects = pa.array(base["SUBJECT_ID"].dropna().astype("int32").unique(), type=pa.int32())
+hadms = pa.array(base["HADM_ID"].dropna().astype("int32").unique(), type=pa.int32())
 
 # 2) Stream target file and filter by ITEMID and base keys
 usecols = ["SUBJECT_ID", "HADM_ID", "ITEMID", "VALUE", "VALUEUOM"]
-dtypes = {
-    "SUBJECT_ID": "Int64",
-    "HADM_ID": "Int64",
-    "ITEMID": "Int64",
-    "VALUE": "string",
-    "VALUEUOM": "string",
+column_types = {
+    "SUBJECT_ID": pa.int32(),  # all MIMIC IDs fit in int32
+    "HADM_ID": pa.int32(),
+    "ITEMID": pa.int32(),
+    "VALUE": pa.string(),
+    "VALUEUOM": pa.string(),
 }
-chunksize = 1_000_000
-first_write = True
-
-# Remove previous output if present
-if os.path.exists(output_path):
-    os.remove(output_path)
-
-for chunk in pd.read_csv(
+reader = pacsv.open_csv(
     target_path,
-    usecols=usecols,
-    dtype=dtypes,
-    chunksize=chunksize,
-    low_memory=False,
-):
-    # Keep only ITEMID == 226512
-    chunk = chunk[chunk["ITEMID"] == ITEM_ID]
-    if chunk.empty:
-        continue
+    read_options=pacsv.ReadOptions(block_size=64 << 20),
+    convert_options=pacsv.ConvertOptions(
+        include_columns=usecols,
+        column_types=column_types,
+        strings_can_be_null=True,
+    ),
+)
+out_schema = pa.schema([
+    ("SUBJECT_ID", pa.int32()),
+    ("HADM_ID", pa.int32()),
+    ("Weight", pa.float32()),
+    ("VALUEUOM", pa.string()),
+])
 
-    # Keep rows that match either SUBJECT_ID or HADM_ID in the base lists
-    mask_subject = chunk["SUBJECT_ID"].isin(subjects)
-    mask_hadm = chunk["HADM_ID"].isin(hadms)
-    chunk = chunk[mask_subject | mask_hadm]
-    if chunk.empty:
-        continue
+# Remove previous outputs if present
+for p in (output_path, output_pq):
+    if os.path.exists(p):
+        os.remove(p)
 
-    # Select and prepare the four required columns
-    filtered = chunk[["SUBJECT_ID", "HADM_ID", "VALUE", "VALUEUOM"]].copy()
+# Stream into .tmp siblings; they replace the outputs only after the scan completes, so a
+# failed run never leaves truncated outputs that the freshness check would accept
+tmp_csv, tmp_pq = output_path + ".tmp", output_pq + ".tmp"
+n_rows = 0
+writer = pq_writer = None  # opened on the first matching batch, so no files are written when nothing matches
+try:
+    for batch in reader:
+        # Keep ITEMID == 226512 rows that match either SUBJECT_ID or HADM_ID in the base lists
+        keep = pc.and_(
+            pc.equal(batch["ITEMID"], ITEM_ID),
+            pc.or_(
+                pc.is_in(batch["SUBJECT_ID"], value_set=subjects),
+                pc.is_in(batch["HADM_ID"], value_set=hadms),
+            ),
+        )
+        batch = batch.filter(keep)
+        if batch.num_rows == 0:
+            continue
 
-    # Convert VALUE to numeric then rename to Weight
-    filtered["VALUE"] = pd.to_numeric(filtered["VALUE"], errors="coerce")
-    filtered = filtered.rename(columns={"VALUE": "Weight"})
+        # Convert VALUE to numeric (non-numeric -> null); this becomes Weight
+        value = pc.utf8_trim_whitespace(batch["VALUE"])
+        value = pc.if_else(pc.match_substring_regex(value, NUMERIC_RE), value, pa.scalar(None, pa.string()))
+        weight = pc.cast(value, pa.float32())
 
-    # Cleaning: set out-of-range values to NaN
-    filtered.loc[(filtered["Weight"] < 35) | (filtered["Weight"] > 135), "Weight"] = np.nan
+        # Cleaning: set out-of-range values to NaN
+        in_range = pc.and_(pc.greater_equal(weight, 35), pc.less_equal(weight, 135))
+        weight = pc.if_else(in_range, weight, pa.scalar(None, pa.float32()))
 
-    # Ensure column order
-    filtered = filtered[["SUBJECT_ID", "HADM_ID", "Weight", "VALUEUOM"]]
+        # Append in the required column order
+        out = pa.record_batch(
+            [batch["SUBJECT_ID"], batch["HADM_ID"], weight, batch["VALUEUOM"]],
+            schema=out_schema,
+        )
+        if writer is None:
+            writer = pacsv.CSVWriter(tmp_csv, out_schema)
+            pq_writer = pq.ParquetWriter(tmp_pq, out_schema, compression="snappy")
+        writer.write_batch(out)
+        pq_writer.write_batch(out)
+        n_rows += batch.num_rows
+finally:
+    if writer is not None:
+        writer.close()
+        pq_writer.close()
 
-    # Append to output
-    filtered.to_csv(output_path, index=False, mode="a", header=first_write)
-    first_write = False
+if writer is not None:
+    os.replace(tmp_csv, output_path)
+    os.replace(tmp_pq, output_pq)
 
-if os.path.exists(output_path):
-    print(f"✅ Done. Output -> {output_path}")
+if n_rows:
+    print(f"✅ Done. Output -> {output_path} ({n_rows:,} rows)")
 else:
     print("No matching rows found (check ITEMID or base filter).")
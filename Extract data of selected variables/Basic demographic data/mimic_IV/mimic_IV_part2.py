@@ -5,23 +5,46 @@ From /content/filtered_by_ids_20251008_090531/chartevents.csv (target), extract
 columns — subject_id, hadm_id, Weight (renamed from value), and valueuom — keeping
 only rows where subject_id or hadm_id exists in the base file /content/CAD_CABG_loose_intersection.csv,
 and only when ITEMID == 226512. Values <35 or >135 are set to NaN. The script streams
-the target file in chunks for memory efficiency.
+the target file as Arrow record batches (only the five needed columns are parsed, on
+multiple threads) and filters/cleans the batches with Arrow compute kernels on a
+thread pool, writing the results in input order. The parsed target columns are cached
+as chartevents.parquet next to the CSV, so re-runs skip the CSV parse.
 
 Output: /content/WEIGHT_filtered.csv
 """
 
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 base_path = "/content/CAD_CABG_loose_intersection.csv"
 target_path = "/content/filtered_by_ids_20251008_090531/chartevents.csv"
 output_path = "/content/WEIGHT_filtered.csv"
+target_pq = os.path.splitext(target_path)[0] + ".parquet"  # parsed-column cache of the target
 ITEM_ID = 226512
+NUMERIC_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
 
-def resolve_columns(csv_path: str, desired_lower_names):
-    """Case-insensitive resolver: maps desired lowercase names to actual column names in the CSV."""
-    header_cols = pd.read_csv(csv_path, nrows=0).columns
+_HEADER_CACHE: dict = {}  # csv path -> header column names
+
+def read_header(csv_path: str):
+    """Column names of a CSV, read once per path."""
+    if csv_path not in _HEADER_CACHE:
+        _HEADER_CACHE[csv_path] = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    return _HEADER_CACHE[csv_path]
+
+def resolve_columns(csv_path: str, desired_lower_names, header_cols=None):
+    """
+    Case-insensitive resolver: maps desired lowercase names to actual column names in the CSV.
+    header_cols: column names already in hand (e.g. from a finished read); skips the header read.
+    """
+    if header_cols is None:
+        header_cols = read_header(csv_path)
     lower_map = {c.lower(): c for c in header_cols}
     mapping, missing = {}, []
     for name in desired_lower_names:
@@ -35,19 +58,17 @@ def resolve_columns(csv_path: str, desired_lower_names):
         )
     return mapping
 
-# Resolve columns for base and target
-base_map = resolve_columns(base_path, ["subject_id", "hadm_id"])
-target_map = resolve_columns(target_path, ["subject_id", "hadm_id", "itemid", "value", "valueuom"])
+# Read base file (only the ID columns, matched case-insensitively) and resolve from what was read
+base = pd.read_csv(base_path, usecols=lambda c: c.lower() in ("subject_id", "hadm_id"), dtype="Int64")
+base_map = resolve_columns(base_path, ["subject_id", "hadm_id"], header_cols=base.columns)
+base = base.rename(columns={base_map["subject_id"]: "subject_id", base_map["hadm_id"]: "hadm_id"})
 
-# Read base file (only necessary columns) and collect allowed IDs
-base = pd.read_csv(
-    base_path,
-    usecols=[base_map["subject_id"], base_map["hadm_id"]],
-    dtype={base_map["subject_id"]: "Int64", base_map["hadm_id"]: "Int64"},
-).rename(columns={base_map["subject_id"]: "subject_id", base_map["hadm_id"]: "hadm_id"})
+# Resolve target columns from its header (needed up front to restrict the Arrow reader)
+target_map = resolve_columns(target_path, ["subject_id", "hadm_id", "itemid", "value", "valueuom"])
 
-subjects = set(base["subject_id"].dropna().astype(int))
-hadms = set(base["hadm_id"].dropna().astype(int))
+# Typed int64 value sets for Arrow's is_in (no Python-object hashing per cell)
+subj_set = pa.array(np.sort(base["subject_id"].dropna().unique().astype("int64")), type=pa.int64())
+hadm_set = pa.array(np.sort(base["hadm_id"].dropna().unique().astype("int64")), type=pa.int64())
 
 # Prepare chunked reading of the target file
 usecols = [
@@ -57,62 +78,104 @@ usecols = [
     target_map["value"],
     target_map["valueuom"],
 ]
-dtypes = {
-    target_map["subject_id"]: "Int64",
-    target_map["hadm_id"]: "Int64",
-    target_map["itemid"]: "Int64",
-    target_map["value"]: "string",
-    target_map["valueuom"]: "string",
+column_types = {
+    target_map["subject_id"]: pa.int64(),
+    target_map["hadm_id"]: pa.int64(),
+    target_map["itemid"]: pa.int64(),
+    target_map["value"]: pa.string(),
+    target_map["valueuom"]: pa.string(),
 }
-chunksize = 1_000_000
-first_write = True
+out_schema = pa.schema([
+    ("subject_id", pa.int64()),
+    ("hadm_id", pa.int64()),
+    ("Weight", pa.float32()),
+    ("valueuom", pa.string()),
+])
+writer = None  # opened on the first matching batch, so no file is written when nothing matches
 
 # Remove previous output if present
 if os.path.exists(output_path):
     os.remove(output_path)
 
-for chunk in pd.read_csv(
-    target_path,
-    usecols=usecols,
-    dtype=dtypes,
-    chunksize=chunksize,
-    low_memory=False,
+def caching_batches(reader, pq_path: str):
+    """Yield the reader's batches while copying them into a zstd Parquet cache, published once complete."""
+    tmp = pq_path + ".tmp"
+    with pq.ParquetWriter(tmp, reader.schema, compression="zstd") as pq_writer:
+        for batch in reader:
+            pq_writer.write_batch(batch)
+            yield batch
+    os.replace(tmp, pq_path)
+    print(f"Cached {target_path} -> {pq_path}")
+
+# Re-runs read the parsed columns back from Parquet; the cache is rebuilt when the CSV is newer
+if (
+    os.path.exists(target_pq)
+    and os.path.getmtime(target_pq) >= os.path.getmtime(target_path)
+    and set(usecols) <= set(pq.read_schema(target_pq).names)
 ):
-    # Normalize column names
-    chunk = chunk.rename(
-        columns={
-            target_map["subject_id"]: "subject_id",
-            target_map["hadm_id"]: "hadm_id",
-            target_map["itemid"]: "itemid",
-            target_map["value"]: "value",
-            target_map["valueuom"]: "valueuom",
-        }
+    batches = pq.ParquetFile(target_pq, memory_map=True).iter_batches(batch_size=1 << 20, columns=usecols)
+else:
+    reader = pacsv.open_csv(
+        target_path,
+        read_options=pacsv.ReadOptions(block_size=64 << 20, use_threads=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=usecols,
+            column_types=column_types,
+            strings_can_be_null=True,
+        ),
     )
+    batches = caching_batches(reader, target_pq)
 
-    # ITEMID filter
-    chunk = chunk[chunk["itemid"] == ITEM_ID]
-    if chunk.empty:
-        continue
+def process_batch(batch):
+    """Filter one chartevents batch and return its cleaned output batch (None when nothing matches)."""
+    # ITEMID filter and subject_id OR hadm_id membership, evaluated on the Arrow batch
+    keep = pc.and_(
+        pc.equal(batch[target_map["itemid"]], ITEM_ID),
+        pc.or_(
+            pc.is_in(batch[target_map["subject_id"]], value_set=subj_set),
+            pc.is_in(batch[target_map["hadm_id"]], value_set=hadm_set),
+        ),
+    )
+    batch = batch.filter(keep)
+    if batch.num_rows == 0:
+        return None
 
-    # Keep rows that match either subject_id or hadm_id in the base lists
-    mask_subject = chunk["subject_id"].isin(subjects)
-    mask_hadm = chunk["hadm_id"].isin(hadms)
-    chunk = chunk[mask_subject | mask_hadm]
-    if chunk.empty:
-        continue
+    # value -> Weight: non-numeric and out-of-range (<35 or >135) become null, in one Arrow pass
+    value = pc.utf8_trim_whitespace(batch[target_map["value"]])
+    value = pc.if_else(pc.match_substring_regex(value, NUMERIC_RE), value, pa.scalar(None, pa.string()))
+    weight = pc.cast(value, pa.float32())
+    in_range = pc.and_(pc.greater_equal(weight, 35), pc.less_equal(weight, 135))
+    weight = pc.if_else(in_range, weight, pa.scalar(None, pa.float32()))
+
+    return pa.RecordBatch.from_arrays(
+        [batch[target_map["subject_id"]], batch[target_map["hadm_id"]], weight, batch[target_map["valueuom"]]],
+        schema=out_schema,
+    )
 
-    # Select required columns and clean
-    out = chunk[["subject_id", "hadm_id", "value", "valueuom"]].copy()
-    out["value"] = pd.to_numeric(out["value"], errors="coerce")
-    out = out.rename(columns={"value": "Weight"})
-    out.loc[(out["Weight"] < 35) | (out["Weight"] > 135), "Weight"] = np.nan
-    out = out[["subject_id", "hadm_id", "Weight", "valueuom"]]
+def cleaned_batches(batches, window: int):
+    """
+    Run process_batch on a thread pool (Arrow kernels release the GIL) while the reader
+    parses ahead; at most `window` batches are in flight and results come back in input order.
+    """
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(process_batch, batch))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
-    # Append to output
-    out.to_csv(output_path, index=False, mode="a", header=first_write)
-    first_write = False
+for out in cleaned_batches(batches, window=os.cpu_count() or 1):
+    if out is None:
+        continue
+    # Append to output through one writer held open for the whole scan
+    if writer is None:
+        writer = pacsv.CSVWriter(output_path, out_schema)
+    writer.write_batch(out)
 
-if os.path.exists(output_path):
+if writer is not None:
+    writer.close()
     print(f"✅ Done. Output -> {output_path}")
 else:
     print("No matching rows found (check base filtering, ITEMID, and column names).")
@@ -13,28 +13,56 @@ Outputs 7 columns:
   subject_id, hadm_id, diabetes, hypertension, ckd, chronic_lung_dz, chronic_endocrine_dz
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+# "string" dtype is backed by Arrow buffers, so .str ops run as Arrow kernels
+pd.set_option("mode.string_storage", "pyarrow")
 
 # ===== Paths =====
 BASE_PATH = "/content/CAD_CABG_loose_intersection.csv"
 DIAG_PATH = "/content/filtered_by_patientunitstayid_20251009_013746_unzipped/diagnoses_icd.csv"
 DICT_PATH = "/content/filtered_by_patientunitstayid_20251009_013746_unzipped/d_icd_diagnoses.csv"
 OUT_PATH  = str(Path(BASE_PATH).with_name(Path(BASE_PATH).stem + "_comorbidities_hadm_or_subject.csv"))
+OUT_PQ    = str(Path(OUT_PATH).with_suffix(".parquet"))  # typed sibling for downstream scripts
+
+def outputs_fresh(inputs, outputs) -> bool:
+    """True if every output exists and is newer than every input."""
+    if not all(Path(p).exists() for p in outputs):
+        return False
+    return min(Path(p).stat().st_mtime for p in outputs) > max(Path(p).stat().st_mtime for p in inputs)
+
+def save(out: pd.DataFrame):
+    """Write CSV + Parquet to .tmp paths first, so a failed run never leaves a half-written pair."""
+    tmp_csv, tmp_pq = Path(OUT_PATH + ".tmp"), Path(OUT_PQ + ".tmp")
+    out.to_csv(tmp_csv, index=False)
+    out.to_parquet(tmp_pq, compression="snappy", index=False)
+    tmp_csv.replace(OUT_PATH)
+    tmp_pq.replace(OUT_PQ)
+
+# Re-runs on unchanged inputs are a no-op
+if outputs_fresh([BASE_PATH, DIAG_PATH, DICT_PATH], [OUT_PATH, OUT_PQ]):
+    print(f"Up to date (cache hit): {OUT_PATH}")
+    raise SystemExit(0)
 
 # ===== Load =====
 base = pd.read_csv(BASE_PATH, low_memory=False)
-diag  = pd.read_csv(DIAG_PATH, low_memory=False)
 ddict = pd.read_csv(DICT_PATH, low_memory=False)
+diag_cols = list(pd.read_csv(DIAG_PATH, nrows=0).columns)  # DIAG is streamed below
 
 # Normalize key names in DIAG if uppercase
 rename_map = {}
-if "SUBJECT_ID" in diag.columns and "subject_id" not in diag.columns:
+if "SUBJECT_ID" in diag_cols and "subject_id" not in diag_cols:
     rename_map["SUBJECT_ID"] = "subject_id"
-if "HADM_ID" in diag.columns and "hadm_id" not in diag.columns:
+if "HADM_ID" in diag_cols and "hadm_id" not in diag_cols:
     rename_map["HADM_ID"] = "hadm_id"
-diag = diag.rename(columns=rename_map)
+diag_cols = [rename_map.get(c, c) for c in diag_cols]
 
 # Check baseline schema
 for col in ["subject_id", "hadm_id"]:
@@ -46,20 +74,15 @@ to_int = lambda x: pd.to_numeric(x, errors="coerce").astype("Int64")
 base["subject_id"] = to_int(base["subject_id"])
 base["hadm_id"]    = to_int(base["hadm_id"])
 
-if "subject_id" in diag.columns:
-    diag["subject_id"] = to_int(diag["subject_id"])
-if "hadm_id" in diag.columns:
-    diag["hadm_id"]    = to_int(diag["hadm_id"])
-
 # Identify code/version columns
 code_col = None
 for c in ["icd_code", "ICD_CODE", "code", "diagnosis_code"]:
-    if c in diag.columns:
+    if c in diag_cols:
         code_col = c
         break
 if code_col is None:
     # fallback: pick first column containing 'icd' and 'code'
-    for c in diag.columns:
+    for c in diag_cols:
         cl = c.lower()
         if ("icd" in cl) and ("code" in cl):
             code_col = c
@@ -69,26 +92,64 @@ if code_col is None:
 
 version_col = None
 for c in ["icd_version", "ICD_VERSION", "version"]:
-    if c in diag.columns:
+    if c in diag_cols:
         version_col = c
         break
 if version_col is None:
     raise ValueError("Could not find icd_version column; this script expects 9/10 codes disambiguation.")
 
-# Prepare dotless, uppercase code
-diag["_code_raw"]   = diag[code_col].astype(str).str.strip().str.upper()
-diag["_code_clean"] = diag["_code_raw"].str.replace(".", "", regex=False)
-
 # Filter DIAG to baseline using OR logic (either subject_id or hadm_id)
-subj_set = set(base["subject_id"].dropna().unique())
-hadm_set = set(base["hadm_id"].dropna().unique())
-
-mask = pd.Series(False, index=diag.index)
-if "subject_id" in diag.columns:
-    mask = mask | diag["subject_id"].isin(subj_set)
-if "hadm_id" in diag.columns:
-    mask = mask | diag["hadm_id"].isin(hadm_set)
-diag = diag.loc[mask].copy()
+# ID sets are int64 Arrow arrays; is_in hashes native ints rather than Python objects
+subj_arr = pa.array(base["subject_id"].dropna().unique(), type=pa.int64())
+hadm_arr = pa.array(base["hadm_id"].dropna().unique(), type=pa.int64())
+ID_SETS = {"subject_id": subj_arr, "hadm_id": hadm_arr}
+NUMERIC_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+def batch_ids(col: pa.Array) -> pa.Array:
+    """Text ID column -> int64, non-numeric -> null (as to_numeric(errors="coerce"))."""
+    col = pc.utf8_trim_whitespace(col)
+    col = pc.if_else(pc.match_substring_regex(col, NUMERIC_RE), col, pa.scalar(None, pa.string()))
+    return pc.cast(pc.cast(col, pa.float64()), pa.int64(), safe=False)
+
+def read_diag_filtered(path: str) -> pd.DataFrame:
+    """
+    Stream DIAG as text, reading only the ID/code/version columns, and keep rows whose
+    subject_id OR hadm_id is in the baseline; the full file is never materialized.
+    """
+    on_disk = {v: k for k, v in rename_map.items()}
+    id_cols = [c for c in ID_SETS if c in diag_cols]
+    src = [on_disk.get(c, c) for c in id_cols + [code_col, version_col]]
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=64 << 20),
+        convert_options=pacsv.ConvertOptions(include_columns=src, column_types={c: pa.string() for c in src}),
+    )
+    parts = []
+    for batch in reader:
+        cols = {c: batch_ids(batch[on_disk.get(c, c)]) for c in id_cols}
+        keep = pa.array(np.zeros(batch.num_rows, dtype=bool))
+        for c in id_cols:
+            keep = pc.or_(keep, pc.is_in(cols[c], value_set=ID_SETS[c]))
+        cols[code_col] = batch[code_col]
+        cols[version_col] = batch[version_col]
+        parts.append(pa.table(cols).filter(keep))
+    if not parts:
+        return pd.DataFrame(columns=id_cols + [code_col, version_col])
+    diag = pa.concat_tables(parts).to_pandas()
+    for c in id_cols:
+        diag[c] = to_int(diag[c])
+    return diag
+
+diag = read_diag_filtered(DIAG_PATH)
+
+def clean_codes(s: pd.Series) -> pd.Series:
+    """Trimmed, uppercase, dotless ICD codes via Arrow kernels (kept as string[pyarrow])."""
+    arr = pa.array(s.astype(str).to_numpy(dtype=object), type=pa.string())
+    arr = pc.replace_substring(pc.utf8_upper(pc.utf8_trim_whitespace(arr)), pattern=".", replacement="")
+    return pd.Series(pd.arrays.ArrowStringArray(arr), index=s.index)
+
+# Prepare dotless, uppercase code (only for the rows kept above)
+diag["_code_clean"] = clean_codes(diag[code_col])
 
 # Early exit guard to avoid "all zeros" due to accidental empty filter
 if diag.empty:
@@ -96,7 +157,7 @@ if diag.empty:
     out = base[["subject_id","hadm_id"]].drop_duplicates().copy()
     for c in ["diabetes", "hypertension", "ckd", "chronic_lung_dz", "chronic_endocrine_dz"]:
         out[c] = 0
-    out.to_csv(OUT_PATH, index=False)
+    save(out)
     print("Warning: No diagnosis rows matched baseline by subject_id OR hadm_id. Wrote an all-zero file.")
     print(f"Wrote: {OUT_PATH}")
     raise SystemExit(0)
@@ -119,7 +180,7 @@ for c in ["long_title", "LONG_TITLE", "title", "description"]:
         break
 
 if dict_code_col and dict_ver_col and dict_title_col:
-    ddict["_code_clean"] = ddict[dict_code_col].astype(str).str.strip().str.upper().str.replace(".", "", regex=False)
+    ddict["_code_clean"] = clean_codes(ddict[dict_code_col])
     ddict["_ver"] = pd.to_numeric(ddict[dict_ver_col], errors="coerce").astype("Int64")
     ddict = ddict[["_code_clean", "_ver", dict_title_col]].dropna(subset=["_code_clean", "_ver"])
 else:
@@ -152,42 +213,81 @@ RE_CKD      = re.compile(r"\b(chronic\s+kidney\s+disease|ckd|end[- ]stage\s+rena
 RE_CLD      = re.compile(r"\b(copd|emphysema|chronic\s*bronchitis|bronchiectasis|interstitial\s+lung\s+disease|pulmonary\s+fibrosis|asthma)\b", re.IGNORECASE)
 RE_ENDO     = re.compile(r"\b(hypothyroid|hyperthyroid|thyroiditis|goitre|goiter|cushing|addison|adrenal\s+insufficiency|hyperparathyroid|hypoparathyroid|pituitary|acromegaly|pheochromocytoma|pcos|polycystic\s+ovary)\b", re.IGNORECASE)
 
-def startswith_any(series: pd.Series, prefixes: tuple[str, ...]) -> pd.Series:
-    """Vectorized prefix check on an uppercase, dotless code series."""
-    s = series.fillna("").astype(str)
-    mask = pd.Series(False, index=s.index)
+# All five categories as one alternation (one named group per category), so a
+# title is scanned once instead of once per category.
+TEXT_RES = {
+    "diabetes": RE_DIABETES,
+    "hypertension": RE_HTN,
+    "ckd": RE_CKD,
+    "chronic_lung_dz": RE_CLD,
+    "chronic_endocrine_dz": RE_ENDO,
+}
+RE_TEXT_ALL = re.compile("|".join(f"(?P<{k}>{rx.pattern})" for k, rx in TEXT_RES.items()), re.IGNORECASE)
+
+def text_hits(titles: pd.Series) -> dict[str, np.ndarray]:
+    """Per-row boolean hits for each text category, scanning each distinct title once."""
+    codes, uniques = pd.factorize(titles)
+    names = list(TEXT_RES)
+    hits = np.zeros((len(uniques) + 1, len(names)), dtype=bool)  # last row: missing title
+    for i, t in enumerate(uniques):
+        for m in RE_TEXT_ALL.finditer(t):
+            hits[i, names.index(m.lastgroup)] = True
+    return {k: hits[codes, j] for j, k in enumerate(names)}
+
+ALL_PREFIXES = (ICD10_DIAB + ICD9_DIAB + ICD10_HTN + ICD9_HTN + ICD10_CKD + ICD9_CKD
+                + ICD10_CLD + ICD9_CLD + ICD10_ENDO + ICD9_ENDO)
+
+def code_heads(series: pd.Series, lengths) -> dict[int, pa.Array]:
+    """First-n-character slices of an uppercase, dotless code series, one per prefix length."""
+    arr = pa.array(series.fillna("").astype("string[pyarrow]"))
+    return {n: pc.utf8_slice_codeunits(arr, 0, n) for n in lengths}
+
+def startswith_any(heads: dict[int, pa.Array], prefixes: tuple[str, ...]) -> np.ndarray:
+    """Prefix check as one Arrow is_in per prefix length (heads from code_heads)."""
+    by_len: dict[int, list[str]] = {}
     for p in prefixes:
-        mask = mask | s.str.startswith(p)
+        by_len.setdefault(len(p), []).append(p)
+    mask = np.zeros(len(next(iter(heads.values()))), dtype=bool)
+    for n, ps in by_len.items():
+        mask |= pc.is_in(heads[n], value_set=pa.array(ps)).to_numpy(zero_copy_only=False)
     return mask
 
 # Version masks
 m_v9  = diag["_ver"] == 9
 m_v10 = diag["_ver"] == 10
 
-codes = diag["_code_clean"]
-
-# Code-based hits (by version)
-hit_diab = (m_v10 & startswith_any(codes, ICD10_DIAB)) | (m_v9 & startswith_any(codes, ICD9_DIAB))
-hit_htn  = (m_v10 & startswith_any(codes, ICD10_HTN )) | (m_v9 & startswith_any(codes, ICD9_HTN ))
-hit_ckd  = (m_v10 & startswith_any(codes, ICD10_CKD )) | (m_v9 & startswith_any(codes, ICD9_CKD ))
-hit_cld  = (m_v10 & startswith_any(codes, ICD10_CLD )) | (m_v9 & startswith_any(codes, ICD9_CLD ))
-hit_endo = (m_v10 & startswith_any(codes, ICD10_ENDO)) | (m_v9 & startswith_any(codes, ICD9_ENDO))
+codes = code_heads(diag["_code_clean"], {len(p) for p in ALL_PREFIXES})
 
 # Text-based fallback using dictionary long titles (if available)
-titles = diag["__long_title__"].fillna("").astype(str).str.lower()
-
-txt_diab = titles.str.contains(RE_DIABETES)
-txt_htn  = titles.str.contains(RE_HTN)
-txt_ckd  = titles.str.contains(RE_CKD)
-txt_cld  = titles.str.contains(RE_CLD)
-txt_endo = titles.str.contains(RE_ENDO)
+titles = diag["__long_title__"].astype("string").fillna("").str.lower()
+txt = text_hits(titles)
+
+# ICD-10 / ICD-9 prefixes per output flag
+FAMILIES = {
+    "diabetes":             (ICD10_DIAB, ICD9_DIAB),
+    "hypertension":         (ICD10_HTN,  ICD9_HTN),
+    "ckd":                  (ICD10_CKD,  ICD9_CKD),
+    "chronic_lung_dz":      (ICD10_CLD,  ICD9_CLD),
+    "chronic_endocrine_dz": (ICD10_ENDO, ICD9_ENDO),
+}
+
+def family_row(name: str) -> pd.Series:
+    """Per-row flag for one family: code hit (by version) OR text hit."""
+    icd10, icd9 = FAMILIES[name]
+    hit = (m_v10 & startswith_any(codes, icd10)) | (m_v9 & startswith_any(codes, icd9))
+    return (hit | txt[name]).astype(int)
+
+# Families are independent; Arrow's is_in releases the GIL, so threads share the
+# code/title arrays without copying them to worker processes
+with ThreadPoolExecutor(max_workers=len(FAMILIES)) as pool:
+    rows = dict(zip(FAMILIES, pool.map(family_row, FAMILIES)))
 
 # Final per-row flags (code OR text)
-row_diab = (hit_diab | txt_diab).astype(int)
-row_htn  = (hit_htn  | txt_htn ).astype(int)
-row_ckd  = (hit_ckd  | txt_ckd ).astype(int)
-row_cld  = (hit_cld  | txt_cld ).astype(int)
-row_endo = (hit_endo | txt_endo).astype(int)
+row_diab = rows["diabetes"]
+row_htn  = rows["hypertension"]
+row_ckd  = rows["ckd"]
+row_cld  = rows["chronic_lung_dz"]
+row_endo = rows["chronic_endocrine_dz"]
 
 diag_flags = pd.DataFrame({
     "subject_id": diag["subject_id"] if "subject_id" in diag.columns else pd.Series([pd.NA]*len(diag), dtype="Int64"),
@@ -214,29 +314,24 @@ if "hadm_id" in diag.columns:
     if not had.empty:
         by_hadm = had.groupby("hadm_id", as_index=False)[agg_cols].max()
 
-# Merge onto baseline and combine via max
-out = base[["subject_id","hadm_id"]].drop_duplicates().copy()
-for c in agg_cols:
-    out[c] = 0
+def packed_flags(by: pd.DataFrame, key: str) -> pd.Series:
+    """key -> uint8 bitmask with bit i set when agg_cols[i] is 1."""
+    bits = np.zeros(len(by), dtype=np.uint8)
+    for i, c in enumerate(agg_cols):
+        bits |= by[c].to_numpy().astype(np.uint8) * np.uint8(1 << i)
+    return pd.Series(bits, index=by[key].to_numpy())
 
-if by_subject is not None:
-    out = out.merge(by_subject, on="subject_id", how="left", suffixes=("", "_sub"))
-    for c in agg_cols:
-        out[c] = out[[c, f"{c}_sub"]].max(axis=1, skipna=True)
-    out = out.drop(columns=[f"{c}_sub" for c in agg_cols])
-
-if by_hadm is not None:
-    out = out.merge(by_hadm, on="hadm_id", how="left", suffixes=("", "_hadm"))
-    for c in agg_cols:
-        out[c] = out[[c, f"{c}_hadm"]].max(axis=1, skipna=True)
-    out = out.drop(columns=[f"{c}_hadm" for c in agg_cols])
-
-# Final types
-for c in agg_cols:
-    out[c] = out[c].fillna(0).astype("int8")
+# Look up both keys on the baseline and OR the packed masks, then unpack one column per flag
+out = base[["subject_id","hadm_id"]].drop_duplicates().copy()
+combined = np.zeros(len(out), dtype=np.uint8)
+for by, key in ((by_subject, "subject_id"), (by_hadm, "hadm_id")):
+    if by is not None:
+        combined |= out[key].map(packed_flags(by, key)).fillna(0).to_numpy().astype(np.uint8)
+for i, c in enumerate(agg_cols):
+    out[c] = ((combined >> i) & 1).astype("int8")
 
 # Save
-out.to_csv(OUT_PATH, index=False)
+save(out)
 
 # Minimal diagnostics to help verify matches
 print(f"Wrote: {OUT_PATH}")
@@ -5,25 +5,25 @@ from pathlib import Path
 INPUT_PATH = Path("/content/ADMISSIONS.csv")
 OUTPUT_PATH = INPUT_PATH.with_name("mimic_III_death.csv")
 
-def find_col(df: pd.DataFrame, target: str) -> str | None:
+def col_index(df: pd.DataFrame) -> dict:
     """
-    Return the actual column name in df that matches `target`
-    in a case/space-insensitive way, else None.
+    Map each column name, case/space-normalized, to the actual column name
+    (first occurrence wins). Build once per frame and look up with .get().
     """
-    t = target.strip().lower()
+    index = {}
     for c in df.columns:
-        if str(c).strip().lower() == t:
-            return c
-    return None
+        index.setdefault(str(c).strip().lower(), c)
+    return index
 
 def main() -> None:
     # Load
     df = pd.read_csv(INPUT_PATH)
 
     # Resolve required columns (case-insensitive)
-    col_subj  = find_col(df, "SUBJECT_ID")
-    col_hadm  = find_col(df, "HADM_ID")
-    col_dtime = find_col(df, "DEATHTIME")
+    cols = col_index(df)
+    col_subj  = cols.get("subject_id")
+    col_hadm  = cols.get("hadm_id")
+    col_dtime = cols.get("deathtime")
 
     missing = [name for name, col in {
         "SUBJECT_ID": col_subj,
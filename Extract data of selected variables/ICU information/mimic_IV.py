@@ -6,44 +6,42 @@ Save to /content/icustays_mimic_IV.csv.
 """
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 INPUT = Path("/content/icustays.csv")
 OUTPUT = INPUT.with_name(f"{INPUT.stem}_mimic_IV{INPUT.suffix}")
 REQUIRED = ["subject_id", "hadm_id", "last_careunit", "intime", "los"]
 
-def map_last_to_icutype(x) -> pd.Series:
-    """Return one of {CSRU, CCU, MICU, SICU, TSICU} or <NA> for non-ICU/unknown."""
-    if pd.isna(x):
-        return pd.NA
-    s = str(x).strip().upper()
+ICU_ABBR = ["CSRU", "CCU", "MICU", "SICU", "TSICU"]
 
-    # already an abbreviation
-    if s in {"CSRU", "CCU", "MICU", "SICU", "TSICU"}:
-        return s
+def map_last_to_icutype(units: pd.Series) -> pd.Series:
+    """
+    Map a whole last_careunit column to {CSRU, CCU, MICU, SICU, TSICU} or <NA> for non-ICU/unknown.
+    The rules run on the distinct unit names only; the result is a categorical over ICU_ABBR.
+    """
+    codes, uniques = pd.factorize(units)
+    s = pd.Series(uniques).astype("string").str.strip().str.upper()
+    has = lambda k: s.str.contains(k, regex=False, na=False)
 
-    # deterministic aliases
-    if "CVICU" in s or "CARDIAC VASCULAR" in s or "CARDIAC SURGERY" in s:
-        return "CSRU"
-    if "CORONARY" in s:
-        return "CCU"
-    if "TRAUMA" in s and "SICU" in s:
-        return "TSICU"
-    if "MICU/SICU" in s:
-        return "SICU"
-    if "NEURO" in s and "SICU" in s:
-        return "SICU"
-    if "MICU" in s:
-        return "MICU"
-    if "SICU" in s:
-        return "SICU"
+    # conditions in priority order (first match wins), mirroring the original if/elif chain
+    conds = [
+        s.isin(ICU_ABBR),                                                  # already an abbreviation
+        has("CVICU") | has("CARDIAC VASCULAR") | has("CARDIAC SURGERY"),   # deterministic aliases
+        has("CORONARY"),
+        has("TRAUMA") & has("SICU"),
+        has("MICU/SICU"),
+        has("NEURO") & has("SICU"),
+        has("MICU"),
+        has("SICU"),
+    ]
+    choices = [s.to_numpy(dtype=object, na_value=None), "CSRU", "CCU", "TSICU", "SICU", "SICU", "MICU", "SICU"]
 
-    # non-ICU / stepdown / other -> NA (do not drop, as requested)
-    if any(k in s for k in ["PACU", "INTERMEDIATE", "STEPDOWN"]):
-        return pd.NA
-
-    # unknown -> NA
-    return pd.NA
+    # non-ICU (PACU / intermediate / stepdown) and unknown -> NA (do not drop, as requested)
+    mapped = np.select([c.to_numpy(dtype=bool) for c in conds], choices, default=None)
+    # category code per distinct unit, plus a trailing -1 (NA) slot for factor code -1 (missing unit)
+    unit_cat = np.append(pd.Categorical(mapped, categories=ICU_ABBR).codes, -1)
+    return pd.Series(pd.Categorical.from_codes(unit_cat[codes], categories=ICU_ABBR), index=units.index)
 
 def main():
     df = pd.read_csv(INPUT)
@@ -61,7 +59,7 @@ def main():
     )
 
     # map ICU types; non-ICU stays become <NA> (kept)
-    out["ICUtype"] = out["ICUtype"].apply(map_last_to_icutype)
+    out["ICUtype"] = map_last_to_icutype(out["ICUtype"])
 
     # enforce output column order
     out = out[["subject_id", "hadm_id", "ICUtype", "intime", "los"]]
@@ -9,43 +9,53 @@ Extract serum albumin (ITEMID=50862) from an UPPERCASE LABEVENTS file and clean
 """
 
 from pathlib import Path
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 SRC = Path("/content/filtered_by_ids/LABEVENTS.csv")
 OUT = SRC.with_name("albumin_50862_clean.csv")
 ITEMID = 50862
 LOW, HIGH = 2.0, 5.0  # g/dL
+NUMERIC_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
 
-# Read only needed columns (UPPERCASE in this file)
+# Stream only the needed columns (UPPERCASE in this file) and keep target-item rows per batch
 usecols = ["SUBJECT_ID", "ITEMID", "VALUE", "VALUEUOM", "CHARTTIME"]
-df = pd.read_csv(SRC, usecols=usecols)
-
-# Filter target item and select/rename columns
-alb = (
-    df.loc[df["ITEMID"] == ITEMID, ["SUBJECT_ID", "VALUE", "VALUEUOM", "CHARTTIME"]]
-      .rename(columns={
-          "SUBJECT_ID": "subject_id",
-          "VALUE": "Albumin",
-          "VALUEUOM": "valueuom",
-          "CHARTTIME": "Albumin_charttime"
-      })
-      .reset_index(drop=True)
+reader = pacsv.open_csv(
+    SRC,
+    read_options=pacsv.ReadOptions(block_size=64 << 20),
+    convert_options=pacsv.ConvertOptions(
+        include_columns=usecols,
+        column_types={
+            "SUBJECT_ID": pa.int64(),
+            "ITEMID": pa.int64(),
+            "VALUE": pa.string(),
+            "VALUEUOM": pa.string(),
+            "CHARTTIME": pa.string(),
+        },
+        strings_can_be_null=True,
+    ),
 )
+batches = [b.filter(pc.equal(b["ITEMID"], ITEMID)) for b in reader]
+alb = pa.Table.from_batches(batches, schema=reader.schema)
 
-# Parse numeric from 'Albumin' (strip leading comparison signs like <, >, <=, >=)
-alb["Albumin"] = (
-    alb["Albumin"].astype(str)
-      .str.strip()
-      .str.replace(r"^[<>]=?\s*", "", regex=True)
-      .pipe(pd.to_numeric, errors="coerce")
-)
+# Parse numeric from VALUE (strip leading comparison signs like <, >, <=, >=)
+value = pc.replace_substring_regex(pc.utf8_trim_whitespace(alb["VALUE"]), r"^[<>]=?\s*", "")
+value = pc.if_else(pc.match_substring_regex(value, NUMERIC_RE), value, pa.scalar(None, pa.string()))
+value = pc.cast(value, pa.float64())
 
 # Apply cleaning rule: values <2 or >5 g/dL -> NA
-mask_out_of_range = (alb["Albumin"] < LOW) | (alb["Albumin"] > HIGH)
-alb.loc[mask_out_of_range, "Albumin"] = pd.NA
+in_range = pc.and_(pc.greater_equal(value, LOW), pc.less_equal(value, HIGH))
+value = pc.if_else(in_range, value, pa.scalar(None, pa.float64()))
 
 # Save only the requested 4 columns
-alb[["subject_id", "Albumin", "valueuom", "Albumin_charttime"]].to_csv(OUT, index=False)
+alb = pa.table({
+    "subject_id": alb["SUBJECT_ID"],
+    "Albumin": value,
+    "valueuom": alb["VALUEUOM"],
+    "Albumin_charttime": alb["CHARTTIME"],
+}).to_pandas()
+alb.to_csv(OUT, index=False)
 
 print(f"Saved: {OUT}  rows={len(alb)}")
 print(alb["valueuom"].value_counts(dropna=False).head())
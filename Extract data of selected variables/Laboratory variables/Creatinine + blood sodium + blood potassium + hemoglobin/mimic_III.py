@@ -46,25 +46,37 @@ OUT_UNIT = {
 }
 
 # -------- Load --------
-df = pd.read_csv(PATH_IN, low_memory=False)
+# Only the five needed columns; ITEMID/VALUEUOM are low-cardinality -> category
+NEEDED = ["subject_id", "itemid", "valuenum", "valueuom", "charttime"]
+header = {c.lower(): c for c in pd.read_csv(PATH_IN, nrows=0).columns}
+df = pd.read_csv(
+    PATH_IN,
+    usecols=[header[n] for n in NEEDED if n in header],
+    dtype={header[n]: "category" for n in ("itemid", "valueuom") if n in header},
+    low_memory=False,
+)
 df.columns = [c.lower() for c in df.columns]
 
-def pick(df, name):
-    for c in df.columns:
-        if c.lower() == name.lower():
-            return c
-    raise KeyError(f"Missing required column: {name}")
-
-col_subj     = pick(df, "subject_id")
-col_itemid   = pick(df, "itemid")
-col_value    = pick(df, "valuenum")
-col_valueuom = pick(df, "valueuom")
-col_time     = pick(df, "charttime")
+# Columns were resolved through the lowercase name map above and lowercased on load
+missing = [n for n in NEEDED if n not in header]
+if missing:
+    raise KeyError(f"Missing required column: {missing[0]}")
+col_subj, col_itemid, col_value, col_valueuom, col_time = NEEDED
 
 # Basic typing / normalization
 df[col_value] = pd.to_numeric(df[col_value], errors="coerce")
 df[col_time]  = pd.to_datetime(df[col_time], errors="coerce")
-df[col_valueuom] = df[col_valueuom].astype(str).str.strip().str.lower()
+# category parsing yields string categories; make ITEMID categories numeric
+df[col_itemid] = df[col_itemid].cat.rename_categories(pd.to_numeric(df[col_itemid].cat.categories))
+# normalize unit labels once per category rather than once per row
+df[col_valueuom] = df[col_valueuom].map(lambda u: str(u).strip().lower())
+
+def item_mask(iid):
+    # compare integer category codes instead of the values themselves
+    cats = df[col_itemid].cat.categories
+    if iid not in cats:
+        return np.zeros(len(df), dtype=bool)
+    return df[col_itemid].cat.codes.to_numpy() == cats.get_loc(iid)
 
 def extract_long(analyte: str, out_csv_path: str):
     iid = ITEMIDS[analyte]
@@ -72,7 +84,7 @@ def extract_long(analyte: str, out_csv_path: str):
     lo, hi = RANGE[analyte]
     out_unit_canonical = OUT_UNIT[analyte]
 
-    d = df.loc[df[col_itemid] == iid, [col_subj, col_time, col_value, col_valueuom]].copy()
+    d = df.loc[item_mask(iid), [col_subj, col_time, col_value, col_valueuom]].copy()
     # keep only allowed units
     d = d[d[col_valueuom].isin(allowed)]
 
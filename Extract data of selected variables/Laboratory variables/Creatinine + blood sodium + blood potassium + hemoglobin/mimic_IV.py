@@ -5,19 +5,43 @@ Each CSV has 4 columns:
   subject_id, <Analyte>, <Analyte>_valueuom, <Analyte>_charttime
 Analytes (ITEMID): Creatinine(50912), Sodium(50983), Potassium(50971), Hemoglobin(51222)
 Units kept/normalized and ranges cleaned as agreed. All rows kept (no per-subject earliest).
+labevents is converted once to a Parquet cache; later runs read only the five needed columns.
 """
 
+import os
+from pathlib import Path
 import pandas as pd
-import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# "string" dtype is backed by Arrow buffers, so .str ops run as Arrow kernels
+pd.set_option("mode.string_storage", "pyarrow")
 
 # -------- Paths --------
 PATH_IN = "/content/labevents.csv"
+PATH_PQ = PATH_IN.replace(".csv", ".parquet")   # typed, compressed cache of PATH_IN
 
 OUT_CRE = "/content/creatinine_long_4cols.csv"
 OUT_NA  = "/content/sodium_long_4cols.csv"
 OUT_K   = "/content/potassium_long_4cols.csv"
 OUT_HGB = "/content/hemoglobin_long_4cols.csv"
 
+def pq_sibling(csv_path: str) -> str:
+    return str(Path(csv_path).with_suffix(".parquet"))
+
+def outputs_fresh(inputs, outputs) -> bool:
+    """True if every output exists and is newer than every input."""
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    return min(os.path.getmtime(p) for p in outputs) > max(os.path.getmtime(p) for p in inputs)
+
+# Re-runs on an unchanged labevents file are a no-op
+ALL_OUTS = [OUT_CRE, OUT_NA, OUT_K, OUT_HGB]
+if outputs_fresh([PATH_IN], ALL_OUTS + [pq_sibling(p) for p in ALL_OUTS]):
+    print("Up to date (cache hit): " + ", ".join(ALL_OUTS))
+    raise SystemExit(0)
+
 # -------- Fixed params --------
 ITEMIDS = {
     "Creatinine": 50912,   # mg/dL
@@ -47,57 +71,85 @@ OUT_UNIT = {
     "Hemoglobin": "g/dL",
 }
 
-# -------- Load --------
-df = pd.read_csv(PATH_IN, low_memory=False)
-df.columns = [c.lower() for c in df.columns]
-
-def pick(df, name):
-    for c in df.columns:
-        if c.lower() == name.lower():
-            return c
-    raise KeyError(f"Missing required column: {name}")
+TIME_FMT = "%Y-%m-%d %H:%M:%S"   # MIMIC-IV charttime layout; fixed format skips per-row inference
 
-col_subj     = pick(df, "subject_id")
-col_itemid   = pick(df, "itemid")
-col_value    = pick(df, "valuenum")
-col_valueuom = pick(df, "valueuom")
-col_time     = pick(df, "charttime")
+NEEDED = ["subject_id", "itemid", "valuenum", "valueuom", "charttime"]
 
-# Basic typing / normalization
-df[col_value]    = pd.to_numeric(df[col_value], errors="coerce")
-df[col_time]     = pd.to_datetime(df[col_time], errors="coerce")
-df[col_valueuom] = df[col_valueuom].astype(str).str.strip().str.lower()
-
-def extract_long(analyte: str, out_csv_path: str):
-    """Filter by itemid and allowed units, clean by fixed ranges, keep ALL rows."""
-    iid = ITEMIDS[analyte]
-    allowed = {u.lower() for u in UNIT_ALLOW[analyte]}
-    lo, hi = RANGE[analyte]
-    out_unit_canonical = OUT_UNIT[analyte]
-
-    d = df.loc[df[col_itemid] == iid, [col_subj, col_time, col_value, col_valueuom]].copy()
+# -------- Load --------
+def ensure_parquet(csv_path: str, pq_path: str):
+    """One-time CSV → Parquet (snappy) conversion; rebuilt if the CSV is newer."""
+    if os.path.exists(pq_path) and os.path.getmtime(pq_path) >= os.path.getmtime(csv_path):
+        return
+    header = pd.read_csv(csv_path, nrows=0).columns
+    # IDs typed (int32 fits MIMIC); everything else kept as text so later coercion matches read_csv(...) + to_numeric
+    types = {c: (pa.int32() if c.lower() in ("subject_id", "itemid") else pa.string()) for c in header}
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=64 << 20),
+        convert_options=pacsv.ConvertOptions(column_types=types, strings_can_be_null=True),
+    )
+    tmp = pq_path + ".tmp"
+    with pq.ParquetWriter(tmp, reader.schema, compression="snappy") as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    os.replace(tmp, pq_path)
+    print(f"Cached {csv_path} -> {pq_path}")
+
+ensure_parquet(PATH_IN, PATH_PQ)
+names = {c.lower(): c for c in pq.read_schema(PATH_PQ).names}
+# text columns come back as string[pyarrow] rather than object
+df = pq.read_table(PATH_PQ, columns=[names[c] for c in NEEDED if c in names]).to_pandas(
+    types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get
+)
+df.columns = [c.lower() for c in df.columns]
 
-    # Keep only allowed units
-    d = d[d[col_valueuom].isin(allowed)]
+# Columns were resolved through the lowercase name map above and lowercased on load
+missing = [n for n in NEEDED if n not in names]
+if missing:
+    raise KeyError(f"Missing required column: {missing[0]}")
+col_subj, col_itemid, col_value, col_valueuom, col_time = NEEDED
+
+OUT_PATHS = {
+    "Creatinine": OUT_CRE,
+    "Sodium":     OUT_NA,
+    "Potassium":  OUT_K,
+    "Hemoglobin": OUT_HGB,
+}
 
-    # Normalize Na/K unit label to mmol/L (values unchanged, mEq/L==mmol/L)
-    if analyte in ("Sodium", "Potassium"):
-        d.loc[:, col_valueuom] = "mmol/l"
+def clean_all(df: pd.DataFrame) -> pd.DataFrame:
+    """One pass over all four itemids: tag analyte, filter units, clean by fixed ranges, keep ALL rows."""
+    id2name = {iid: name for name, iid in ITEMIDS.items()}
+    pairs = [(name, u.lower()) for name, units in UNIT_ALLOW.items() for u in units]
 
-    # Non-positive to NA where appropriate
-    if analyte in ("Creatinine", "Hemoglobin", "Potassium"):
-        d.loc[d[col_value] <= 0, col_value] = np.nan
+    # Filtered view of the four itemids; typing / unit normalization only for these rows
+    d = df.loc[df[col_itemid].isin(list(id2name)), [col_subj, col_time, col_value, col_valueuom, col_itemid]]
+    d = d.assign(**{
+        "analyte":    d[col_itemid].map(id2name),
+        col_valueuom: d[col_valueuom].str.strip().str.lower(),
+    })
 
-    # Fixed range cleaning
-    d.loc[(d[col_value] < lo) | (d[col_value] > hi), col_value] = np.nan
+    # Keep only allowed (analyte, unit) pairs
+    d = d[pd.MultiIndex.from_arrays([d["analyte"], d[col_valueuom]]).isin(pairs)]
+
+    # Numeric value, non-positive to NA where appropriate and fixed per-analyte range, in one where;
+    # times parsed only for the surviving rows
+    v = pd.to_numeric(d[col_value], errors="coerce").astype("float32")
+    lo = d["analyte"].map({k: r[0] for k, r in RANGE.items()})
+    hi = d["analyte"].map({k: r[1] for k, r in RANGE.items()})
+    pos_ok = ~d["analyte"].isin(["Creatinine", "Hemoglobin", "Potassium"]) | (v > 0)
+    d = d.assign(**{
+        col_value: v.where(pos_ok & (v >= lo) & (v <= hi)),
+        col_time:  pd.to_datetime(d[col_time], format=TIME_FMT, errors="coerce", cache=True),
+    })
 
     # Drop rows lacking value or time
     d = d.dropna(subset=[col_value, col_time])
 
-    # Sort for readability; DO NOT collapse — keep all rows
-    d = d.sort_values([col_subj, col_time])
+    # One sort for all analytes; DO NOT collapse — keep all rows
+    return d.sort_values(["analyte", col_subj, col_time])
 
-    # Rename columns for output and set canonical unit label
+def write_long(analyte: str, d: pd.DataFrame, out_csv_path: str):
+    """Rename one analyte's rows to the 4-column layout with the canonical unit label."""
     out_val  = analyte
     out_unit = f"{analyte}_valueuom"
     out_time = f"{analyte}_charttime"
@@ -108,14 +160,20 @@ def extract_long(analyte: str, out_csv_path: str):
         col_valueuom: out_unit,
         col_time:     out_time
     })
-    d[out_unit] = out_unit_canonical
+    # Na/K mEq/L==mmol/L, so only the label changes
+    d[out_unit] = OUT_UNIT[analyte]
 
     d = d[["subject_id", out_val, out_unit, out_time]]
-    d.to_csv(out_csv_path, index=False)
+    # write to .tmp paths first, so a failed run never leaves a half-written CSV/Parquet pair
+    out_pq_path = pq_sibling(out_csv_path)
+    d.to_csv(out_csv_path + ".tmp", index=False)
+    d.to_parquet(out_pq_path + ".tmp", compression="snappy", index=False)
+    os.replace(out_csv_path + ".tmp", out_csv_path)
+    os.replace(out_pq_path + ".tmp", out_pq_path)
     print(f"{analyte}: saved {out_csv_path}, shape={d.shape}")
 
-# ---- Run for each analyte ----
-extract_long("Creatinine", OUT_CRE)
-extract_long("Sodium",     OUT_NA)
-extract_long("Potassium",  OUT_K)
-extract_long("Hemoglobin", OUT_HGB)
+# ---- Run once, then split per analyte ----
+clean = clean_all(df)
+parts = dict(tuple(clean.groupby("analyte", sort=False)))
+for analyte, out_csv_path in OUT_PATHS.items():
+    write_long(analyte, parts.get(analyte, clean.iloc[:0]), out_csv_path)
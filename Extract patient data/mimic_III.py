@@ -9,7 +9,8 @@ Key features
 ------------
 - OR logic: keep any row where SUBJECT_ID OR HADM_ID matches the baseline.
 - Works with .csv and .csv.gz (compression='infer').
-- Chunked reading for very large files (default 1,000,000 rows per chunk).
+- Streaming PyArrow CSV reader/writer for very large files (default 64 MiB blocks).
+- Input files are filtered in parallel worker processes (--workers).
 - Always writes the header (even if no rows match), per requirement.
 - Case-insensitive column matching (SUBJECT_ID/HADM_ID).
 
@@ -40,18 +41,26 @@ python filter_by_ids.py \
   --inputs /data/A.csv /data/B.csv.gz /data/C.csv \
   --ids /data/patient_ids.csv \
   --out-dir /data/filtered \
-  --chunksize 500000 \
+  --block-size 33554432 \
   --log-every 5
 """
 
 from __future__ import annotations
 
 import argparse
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Iterable, List, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 
 DEFAULT_IDS = "/content/patient_ids_SUBJECT_HADM.csv"
@@ -65,10 +74,21 @@ DEFAULT_INPUTS = [
     "/content/CHARTEVENTS.csv",
 ]
 DEFAULT_OUT_DIR = "/content/filtered_by_ids"
+DEFAULT_BLOCK_SIZE = 64 << 20  # bytes per Arrow record batch
 
 
-def load_id_sets(ids_path: Path) -> Tuple[Set[str], Set[str]]:
-    """Load SUBJECT_ID and HADM_ID sets from the baseline CSV."""
+def id_values(series: pd.Series) -> pa.Array:
+    """Unique IDs as a sorted int64 array when all are integers, else as strings."""
+    s = series.dropna().astype(str).str.strip()
+    s = s[s != ""]
+    v = pd.to_numeric(s, errors="coerce")
+    if v.notna().all() and (v == v.round()).all():
+        return pa.array(np.sort(v.astype("int64").unique()), type=pa.int64())
+    return pa.array(sorted(set(s)), type=pa.string())
+
+
+def load_id_sets(ids_path: Path) -> Tuple[pa.Array, pa.Array]:
+    """Load SUBJECT_ID and HADM_ID value sets from the baseline CSV."""
     if not ids_path.exists():
         raise FileNotFoundError(f"Baseline IDs file not found: {ids_path}")
 
@@ -78,23 +98,72 @@ def load_id_sets(ids_path: Path) -> Tuple[Set[str], Set[str]]:
     if "SUBJECT_ID" not in ids.columns and "HADM_ID" not in ids.columns:
         raise ValueError("Baseline file must contain SUBJECT_ID and/or HADM_ID columns.")
 
-    sub_ids: Set[str] = set()
-    hadm_ids: Set[str] = set()
+    sub_ids = pa.array([], type=pa.int64())
+    hadm_ids = pa.array([], type=pa.int64())
 
     if "SUBJECT_ID" in ids.columns:
-        sub_ids = set(ids["SUBJECT_ID"].dropna().astype(str).str.strip())
+        sub_ids = id_values(ids["SUBJECT_ID"])
     if "HADM_ID" in ids.columns:
-        hadm_ids = set(ids["HADM_ID"].dropna().astype(str).str.strip())
+        hadm_ids = id_values(ids["HADM_ID"])
 
     print(f"[INFO] Loaded baseline IDs: SUBJECT_ID={len(sub_ids):,}, HADM_ID={len(hadm_ids):,}")
     return sub_ids, hadm_ids
 
 
+def id_mask(col: pa.Array, values: pa.Array) -> pa.Array:
+    """Membership mask for an ID column; compares as int64 when both sides are numeric.
+
+    The column is dictionary-encoded so the lookup runs once per distinct ID and
+    is broadcast back to rows through the integer indices.
+    """
+    enc = pc.dictionary_encode(pc.utf8_trim_whitespace(col))
+    uniq = enc.dictionary
+    if pa.types.is_integer(values.type):
+        try:
+            uniq = pc.cast(uniq, pa.int64())
+        except pa.ArrowInvalid:
+            values = pc.cast(values, pa.string())
+    hit = pc.is_in(uniq, value_set=values)
+    return pc.fill_null(pc.take(hit, enc.indices), False)
+
+
+def write_id_file(values: pa.Array, path: Path) -> None:
+    """Write an ID value set as a single-batch Arrow IPC file."""
+    batch = pa.record_batch([values], names=["id"])
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+
+def read_id_file(path: Path) -> pa.Array:
+    """Memory-map an ID file written by write_id_file (zero-copy, shared page cache)."""
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).get_batch(0).column(0)
+
+
 def norm_colmap(columns: Iterable[str]) -> Dict[str, str]:
     """Build a mapping {UPPER: original_name} without changing original names."""
     return {c.upper(): c for c in columns}
 
 
+def build_predicate(
+    colmap: Dict[str, str],
+    sub_ids: pa.Array,
+    hadm_ids: pa.Array,
+) -> Optional[Callable[[pa.RecordBatch], pa.Array]]:
+    """Specialise the row filter to the ID columns present in a file's schema.
+
+    Returns None when neither SUBJECT_ID nor HADM_ID exists.
+    """
+    sub_col = colmap.get("SUBJECT_ID")
+    hadm_col = colmap.get("HADM_ID")
+    if sub_col is not None and hadm_col is not None:
+        return lambda b: pc.or_(id_mask(b.column(sub_col), sub_ids), id_mask(b.column(hadm_col), hadm_ids))
+    if sub_col is not None:
+        return lambda b: id_mask(b.column(sub_col), sub_ids)
+    if hadm_col is not None:
+        return lambda b: id_mask(b.column(hadm_col), hadm_ids)
+    return None
+
+
 def target_out_path(in_path: Path, out_dir: Path) -> Path:
     """Compute output filename (strip '.gz', ensure '.csv') inside out_dir."""
     name = in_path.name
@@ -108,9 +177,9 @@ def target_out_path(in_path: Path, out_dir: Path) -> Path:
 def process_one_file(
     in_path: Path,
     out_dir: Path,
-    sub_ids: Set[str],
-    hadm_ids: Set[str],
-    chunksize: int = 1_000_000,
+    sub_ids: pa.Array,
+    hadm_ids: pa.Array,
+    block_size: int = DEFAULT_BLOCK_SIZE,
     log_every: int = 10,
 ) -> None:
     """Filter a single CSV/CSV.GZ file by SUBJECT_ID/HADM_ID (OR logic)."""
@@ -123,57 +192,63 @@ def process_one_file(
 
     total_rows = 0
     kept_rows = 0
-    header_written = False
     start = datetime.now()
 
     print(f"\n[START] Filtering: {in_path}")
-    reader = pd.read_csv(
+
+    # Read every column as string so field values are written back unchanged (no numeric
+    # re-formatting); Arrow's writer does quote the header and every non-empty string field.
+    header = pd.read_csv(in_path, nrows=0, compression="infer").columns
+    reader = pacsv.open_csv(
         in_path,
-        dtype=str,
-        chunksize=chunksize,
-        compression="infer",
-        on_bad_lines="skip",
-        low_memory=False,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: "skip"),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in header},
+            strings_can_be_null=True,
+            null_values=[""],
+        ),
     )
 
-    for i, chunk in enumerate(reader, 1):
-        total_rows += len(chunk)
-        if total_rows == 0:
-            continue
-
-        colmap = norm_colmap(chunk.columns)
+    # Schema is fixed across batches: build the filter for its ID columns once.
+    predicate = build_predicate(norm_colmap(reader.schema.names), sub_ids, hadm_ids)
+    if predicate is None:
+        print("  [WARN] Neither SUBJECT_ID nor HADM_ID found in columns; only header written.")
+
+    # The writer emits the header on open (even if no matches in any batch).
+    write_options = pacsv.WriteOptions(include_header=True)
+    with pacsv.CSVWriter(out_path, reader.schema, write_options=write_options) as writer:
+        for i, batch in enumerate(reader, 1):
+            total_rows += batch.num_rows
+            # If neither ID column exists, there is nothing to match; continue.
+            if batch.num_rows == 0 or predicate is None:
+                continue
+
+            matched = batch.filter(predicate(batch))
+            if matched.num_rows:
+                kept_rows += matched.num_rows
+                writer.write_batch(matched)
+
+            if (i % log_every) == 0:
+                rate = (kept_rows / max(total_rows, 1)) * 100.0
+                print(f"  - Progress: batch {i}, read {total_rows:,} rows, kept {kept_rows:,} rows ({rate:.2f}%)")
 
-        # Always write header (even if no matches in any chunk)
-        if not header_written:
-            chunk.head(0).to_csv(out_path, index=False, mode="w", header=True)
-            header_written = True
+    dur = (datetime.now() - start).total_seconds()
+    print(f"[DONE] {in_path.name} -> {out_path.name} | read {total_rows:,}, kept {kept_rows:,}, took {dur:.1f}s")
 
-        # If neither ID column exists, there is nothing to match; continue.
-        if "SUBJECT_ID" not in colmap and "HADM_ID" not in colmap:
-            if i == 1:
-                print("  [WARN] Neither SUBJECT_ID nor HADM_ID found in columns; only header written.")
-            continue
 
-        mask = pd.Series(False, index=chunk.index)
+# Baseline ID sets held by each worker process (mapped once by the pool initializer).
+_WORKER_IDS: Tuple[pa.Array, pa.Array] = (pa.array([], type=pa.int64()), pa.array([], type=pa.int64()))
 
-        if "SUBJECT_ID" in colmap:
-            s = chunk[colmap["SUBJECT_ID"]].astype(str).str.strip().isin(sub_ids)
-            mask = mask | s
-        if "HADM_ID" in colmap:
-            h = chunk[colmap["HADM_ID"]].astype(str).str.strip().isin(hadm_ids)
-            mask = mask | h
 
-        matched = chunk[mask]
-        if not matched.empty:
-            kept_rows += len(matched)
-            matched.to_csv(out_path, index=False, mode="a", header=False)
+def _init_worker(sub_path: Path, hadm_path: Path) -> None:
+    global _WORKER_IDS
+    _WORKER_IDS = (read_id_file(sub_path), read_id_file(hadm_path))
 
-        if (i % log_every) == 0:
-            rate = (kept_rows / max(total_rows, 1)) * 100.0
-            print(f"  - Progress: chunk {i}, read {total_rows:,} rows, kept {kept_rows:,} rows ({rate:.2f}%)")
 
-    dur = (datetime.now() - start).total_seconds()
-    print(f"[DONE] {in_path.name} -> {out_path.name} | read {total_rows:,}, kept {kept_rows:,}, took {dur:.1f}s")
+def _process_in_worker(in_path: Path, out_dir: Path, block_size: int, log_every: int) -> None:
+    sub_ids, hadm_ids = _WORKER_IDS
+    process_one_file(in_path, out_dir, sub_ids, hadm_ids, block_size=block_size, log_every=log_every)
 
 
 def parse_args() -> argparse.Namespace:
@@ -200,16 +275,22 @@ def parse_args() -> argparse.Namespace:
         help=f"Output folder for filtered CSVs (default: {DEFAULT_OUT_DIR})",
     )
     p.add_argument(
-        "--chunksize",
+        "--block-size",
         type=int,
-        default=1_000_000,
-        help="Number of rows per chunk when reading large files (default: 1,000,000).",
+        default=DEFAULT_BLOCK_SIZE,
+        help=f"Bytes per record batch when reading large files (default: {DEFAULT_BLOCK_SIZE:,}).",
     )
     p.add_argument(
         "--log-every",
         type=int,
         default=10,
-        help="Log progress every N chunks (default: 10).",
+        help="Log progress every N batches (default: 10).",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of files filtered in parallel (default: min(#inputs, #CPUs)).",
     )
     return p.parse_args()
 
@@ -220,15 +301,20 @@ def main() -> None:
 
     sub_ids, hadm_ids = load_id_sets(args.ids)
 
-    for fpath in args.inputs:
-        process_one_file(
-            in_path=fpath,
-            out_dir=args.out_dir,
-            sub_ids=sub_ids,
-            hadm_ids=hadm_ids,
-            chunksize=args.chunksize,
-            log_every=args.log_every,
-        )
+    # Files are independent: filter them in parallel, one worker process per file.
+    # Workers memory-map the ID sets from Arrow IPC files rather than each holding a copy.
+    workers = args.workers or min(len(args.inputs), os.cpu_count() or 1)
+    work = partial(_process_in_worker, out_dir=args.out_dir, block_size=args.block_size, log_every=args.log_every)
+    with tempfile.TemporaryDirectory() as tmp:
+        sub_path, hadm_path = Path(tmp) / "subject_ids.arrow", Path(tmp) / "hadm_ids.arrow"
+        write_id_file(sub_ids, sub_path)
+        write_id_file(hadm_ids, hadm_path)
+        with ProcessPoolExecutor(
+            max_workers=max(workers, 1),
+            initializer=_init_worker,
+            initargs=(sub_path, hadm_path),
+        ) as ex:
+            list(ex.map(work, args.inputs))
 
     print(f"\n[ALL DONE] Output directory: {args.out_dir.resolve()}")
 
@@ -9,6 +9,7 @@ Inputs:
   procedures_icd.csv -> columns: subject_id, hadm_id, icd_code
   cad_icd.csv        -> CAD code list; code column auto-detected (supports '*' suffix wildcards)
   cabg_icd.csv       -> CABG code list; code column auto-detected (supports '*' suffix wildcards)
+  (the three event columns are cached as <name>.parquet next to each event CSV)
 
 Outputs:
   outdir/CAD_matches.csv                      # diagnosis matches (unique pairs)
@@ -17,11 +18,18 @@ Outputs:
   outdir/summary.txt
 """
 
-import argparse, re
+import argparse, os, re, sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
-def read_csv_safe(p: Path) -> pd.DataFrame:
+EVENT_COLS = ["subject_id","hadm_id","icd_code"]
+EVENT_TYPES = {"subject_id": pa.int32(), "hadm_id": pa.int32(), "icd_code": pa.string()}
+
+def read_codes_csv(p: Path) -> pd.DataFrame:
     for enc in ("utf-8-sig", "utf-8", "latin1"):
         try:
             return pd.read_csv(p, dtype=str, encoding=enc)
@@ -29,6 +37,27 @@ def read_csv_safe(p: Path) -> pd.DataFrame:
             continue
     return pd.read_csv(p, dtype=str)
 
+def load_events(p: Path, usecols, fname: str) -> pd.DataFrame:
+    """
+    Event table restricted to usecols, cached next to the CSV as Parquet (zstd, int32 IDs,
+    dictionary-encoded icd_code); the cache is rebuilt when the CSV is newer.
+    """
+    pq_path = p.with_suffix(".parquet")
+    if pq_path.exists() and pq_path.stat().st_mtime >= p.stat().st_mtime:
+        tbl = pq.read_table(pq_path, columns=usecols, memory_map=True)
+    else:
+        # header check first so a missing column still reports the available ones
+        ensure_cols(pd.read_csv(p, nrows=0), usecols, fname)
+        tbl = pacsv.read_csv(p, convert_options=pacsv.ConvertOptions(
+            include_columns=usecols,
+            column_types={c: EVENT_TYPES[c] for c in usecols},
+            strings_can_be_null=True,
+        ))
+        tmp = pq_path.with_name(pq_path.name + ".tmp")
+        pq.write_table(tbl, tmp, compression="zstd", use_dictionary=["icd_code"])
+        os.replace(tmp, pq_path)
+    return tbl.to_pandas(types_mapper=pd.ArrowDtype)
+
 def ensure_cols(df: pd.DataFrame, need, fname: str):
     miss = [c for c in need if c not in df.columns]
     if miss:
@@ -55,40 +84,72 @@ def norm_code(x: str) -> str:
     x = ("" if x is None else str(x)).strip().upper()
     return x.replace(".", "")
 
+def norm_codes(s: pd.Series) -> pd.Series:
+    """Vectorized norm_code for a whole event column (missing stays missing)."""
+    return s.str.strip().str.upper().str.replace(".", "", regex=False)
+
+def trie_regex(prefixes) -> str:
+    """
+    Regex matching any string that starts with one of the prefixes, factored into a
+    character trie so shared leading characters are tested once instead of once per
+    alternative. A prefix ending at a node accepts any continuation, so longer prefixes
+    below it are dropped.
+    """
+    trie = {}
+    for w in prefixes:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # end-of-prefix marker
+
+    def emit(node) -> str:
+        if "" in node:
+            return ""
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items())]
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:%s)" % "|".join(alts)
+
+    return emit(trie)
+
 def build_matcher(code_series: pd.Series):
     codes = [norm_code(c) for c in code_series.dropna()]
-    exact, prefixes = set(), []
+    exact, prefixes = set(), set()
     for c in codes:
         if not c:
             continue
         if c.endswith("*"):
-            prefixes.append(c[:-1])
+            if c[:-1]:
+                prefixes.add(c[:-1])
         else:
             exact.add(c)
-    regex = None
-    if prefixes:
-        pats = [re.escape(p) for p in sorted(set(prefixes)) if p]
-        if pats:
-            regex = re.compile(r"^(?:%s)" % "|".join(pats))
-    def _match(s: pd.Series) -> pd.Series:
-        sn = s.astype(str).map(norm_code)
-        m = sn.isin(exact)
-        if regex is not None:
-            m = m | sn.str.match(regex).fillna(False)
-        return m
+    exact = frozenset(sys.intern(c) for c in exact)
+    # wildcard prefixes folded into one anchored trie pattern; no regex at all without wildcards
+    prefix_re = re.compile(r"^(?:%s)" % trie_regex(prefixes)) if prefixes else None
+    def _match(sn: pd.Series) -> pd.Series:
+        """sn: codes already normalized with norm_codes."""
+        if not exact and prefix_re is None:
+            return pd.Series(False, index=sn.index)
+        # test only the distinct codes, then broadcast back by factor code;
+        # the trailing slot serves code -1 (missing), which astype(str) used to turn into "nan"
+        codes, uniques = pd.factorize(sn, sort=False)
+        cand = list(uniques) + [norm_code("nan")]
+        hit = np.array([u in exact for u in cand], dtype=bool)
+        if prefix_re is not None:
+            # set membership first; the prefix regex only sees codes that missed it
+            rest = np.flatnonzero(~hit)
+            hit[rest] = [prefix_re.match(cand[i]) is not None for i in rest]
+        return pd.Series(hit[codes], index=sn.index)
     return _match
 
 # ---------- Core ----------
 def run(diagnoses_path, procedures_path, cad_codes_path, cabg_codes_path, outdir):
     outdir = Path(outdir); outdir.mkdir(parents=True, exist_ok=True)
 
-    diag = read_csv_safe(Path(diagnoses_path))
-    proc = read_csv_safe(Path(procedures_path))
-    cad_list = read_csv_safe(Path(cad_codes_path))
-    cabg_list = read_csv_safe(Path(cabg_codes_path))
-
-    ensure_cols(diag, ["subject_id","hadm_id","icd_code"], "diagnoses_icd.csv")
-    ensure_cols(proc, ["subject_id","hadm_id","icd_code"], "procedures_icd.csv")
+    diag = load_events(Path(diagnoses_path), EVENT_COLS, "diagnoses_icd.csv")
+    proc = load_events(Path(procedures_path), EVENT_COLS, "procedures_icd.csv")
+    cad_list = read_codes_csv(Path(cad_codes_path))
+    cabg_list = read_codes_csv(Path(cabg_codes_path))
 
     cad_col  = find_code_col(cad_list)
     cabg_col = find_code_col(cabg_list)
@@ -96,27 +157,28 @@ def run(diagnoses_path, procedures_path, cad_codes_path, cabg_codes_path, outdir
     cad_matcher  = build_matcher(cad_list[cad_col])
     cabg_matcher = build_matcher(cabg_list[cabg_col])
 
+    # Normalize each event code column once; matchers take the normalized series
+    diag_norm = norm_codes(diag["icd_code"])
+    proc_norm = norm_codes(proc["icd_code"])
+
     # Filter to unique pairs
-    diag_match = diag[cad_matcher(diag["icd_code"])][["subject_id","hadm_id"]].dropna().drop_duplicates()
-    proc_match = proc[cabg_matcher(proc["icd_code"])][["subject_id","hadm_id"]].dropna().drop_duplicates()
+    diag_match = diag[cad_matcher(diag_norm)][["subject_id","hadm_id"]].dropna().drop_duplicates()
+    proc_match = proc[cabg_matcher(proc_norm)][["subject_id","hadm_id"]].dropna().drop_duplicates()
 
     # Normalize id dtype to str
     for df in (diag_match, proc_match):
         df["subject_id"] = df["subject_id"].astype(str)
         df["hadm_id"]    = df["hadm_id"].astype(str)
 
-    # Build intersection sets on subject_id and hadm_id separately
-    subj_inter = set(diag_match["subject_id"]) & set(proc_match["subject_id"])
-    hadm_inter = set(diag_match["hadm_id"])    & set(proc_match["hadm_id"])
-
-    # Keep any row (from either side) that matches by subject OR by hadm
-    both = pd.concat(
-        [diag_match.assign(source="diagnosis"), proc_match.assign(source="procedure")],
-        ignore_index=True
-    ).drop_duplicates()
+    # Build intersections on subject_id and hadm_id separately (hash-based pd.Index ops)
+    subj_inter = pd.Index(diag_match["subject_id"].unique()).intersection(pd.Index(proc_match["subject_id"].unique()))
+    hadm_inter = pd.Index(diag_match["hadm_id"].unique()).intersection(pd.Index(proc_match["hadm_id"].unique()))
 
-    keep_mask = both["subject_id"].isin(subj_inter) | both["hadm_id"].isin(hadm_inter)
-    loose = both.loc[keep_mask, ["subject_id","hadm_id"]].drop_duplicates().reset_index(drop=True)
+    # Keep any row (from either side) that matches by subject OR by hadm; each side is already
+    # unique, so the final drop_duplicates only removes pairs present on both sides
+    def linked(df):
+        return df[df["subject_id"].isin(subj_inter) | df["hadm_id"].isin(hadm_inter)]
+    loose = pd.concat([linked(diag_match), linked(proc_match)]).drop_duplicates().reset_index(drop=True)
 
     # Save
     cad_out   = outdir / "CAD_matches.csv"
@@ -17,24 +17,36 @@ Patterns:
 from __future__ import annotations
 import re
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 def read_csv_any(path: Path) -> pd.DataFrame:
     for enc in ("utf-8-sig", "utf-8", "latin-1"):
         try:
-            return pd.read_csv(path, dtype=str, encoding=enc).fillna("")
+            return pd.read_csv(path, dtype=str, encoding=enc)
         except Exception:
             pass
-    return pd.read_csv(path, dtype=str).fillna("")
+    return pd.read_csv(path, dtype=str)
 
-def pick_col(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
-    cols_lc = {c.lower(): c for c in df.columns}
+def lower_colmap(df: pd.DataFrame) -> Dict[str, str]:
+    return {c.lower(): c for c in df.columns}
+
+def pick_col(cols_lc: Dict[str, str], candidates: List[str]) -> Optional[str]:
     for k in candidates:
         if k.lower() in cols_lc:
             return cols_lc[k.lower()]
     return None
 
+def strip_upper(s: pd.Series) -> pd.Series:
+    # trim + uppercase as one chain of Arrow kernels (no intermediate object Series)
+    arr = pa.array(s.to_numpy(dtype=object, na_value=""), type=pa.string())
+    arr = pc.utf8_upper(pc.utf8_trim_whitespace(arr))
+    return pd.Series(arr.to_numpy(zero_copy_only=False), index=s.index)
+
 def nodot_upper(s: Optional[str]) -> str:
     return re.sub(r"[.\s]", "", (s or "")).upper()
 
@@ -43,10 +55,22 @@ def concat_text_fallback(df: pd.DataFrame, max_cols: int = 8) -> pd.Series:
     obj_cols = obj_cols[:max_cols]
     if not obj_cols:
         return pd.Series([""] * len(df))
-    s = df[obj_cols[0]].astype(str)
-    for c in obj_cols[1:]:
-        s = s.str.cat(" " + df[c].astype(str), sep=" ", na_rep="")
-    return s.str.strip()
+    # one element-wise join into a single buffer (two-space separator as before)
+    parts = [pa.array(df[c].fillna("").astype(str).to_numpy(dtype=object), type=pa.string()) for c in obj_cols]
+    s = pc.utf8_trim_whitespace(pc.binary_join_element_wise(*parts, "  "))
+    return pd.Series(s.to_numpy(zero_copy_only=False), index=df.index)
+
+def sorted_unique(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    # stable sort, then drop rows equal to their predecessor (no string hashing)
+    df = df.sort_values(cols, kind="mergesort")
+    keep = np.ones(len(df), dtype=bool)
+    if len(df) > 1:
+        changed = np.zeros(len(df) - 1, dtype=bool)
+        for c in cols:
+            a = df[c].to_numpy()
+            changed |= a[1:] != a[:-1]
+        keep[1:] = changed
+    return df[keep]
 
 
 # ------------------------- CAD ---------------------------
@@ -67,28 +91,32 @@ def extract_cad_from_diagnosis(diagnosis_csv: Path) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame(columns=["ICD_CODE", "DESCRIPTION"])
 
-    code_col = pick_col(df, ["icd_code","icd10_code","icd9_code","code","icd","dx","dx1"])
-    desc_col = pick_col(df, ["description","long_title","title","desc","diagnosis_description","dx_name","short_title","shorttitle"])
+    cols_lc = lower_colmap(df)
+    code_col = pick_col(cols_lc, ["icd_code","icd10_code","icd9_code","code","icd","dx","dx1"])
+    desc_col = pick_col(cols_lc, ["description","long_title","title","desc","diagnosis_description","dx_name","short_title","shorttitle"])
 
     w = pd.DataFrame(index=df.index)
     if code_col:
-        w["ICD_CODE"] = df[code_col].astype(str).str.strip().str.upper()
+        w["ICD_CODE"] = strip_upper(df[code_col])
     else:
         w["ICD_CODE"] = ""  # ensure column exists
 
     if desc_col:
-        w["DESCRIPTION"] = df[desc_col].astype(str).str.strip()
+        w["DESCRIPTION"] = df[desc_col].fillna("").astype(str).str.strip()
     else:
         w["DESCRIPTION"] = concat_text_fallback(df)
 
     mask_code = w["ICD_CODE"].map(is_cad_code) if code_col else pd.Series(False, index=w.index)
-    mask_text = w["DESCRIPTION"].str.contains(CAD_TEXT_RE, na=False)
+    # text regex only needs to run on rows the code check did not already keep
+    remaining = ~mask_code
+    mask_text = pd.Series(False, index=w.index)
+    mask_text.loc[remaining] = w.loc[remaining, "DESCRIPTION"].str.contains(CAD_TEXT_RE, na=False)
     mask = mask_code | mask_text
 
-    out = w.loc[mask, ["ICD_CODE", "DESCRIPTION"]].drop_duplicates()
+    out = sorted_unique(w.loc[mask, ["ICD_CODE", "DESCRIPTION"]], ["ICD_CODE", "DESCRIPTION"])
     # keep only CAD-valid codes; if not valid for a row, blank it (still 2 columns)
     out.loc[~out["ICD_CODE"].map(is_cad_code), "ICD_CODE"] = ""
-    out = out.sort_values(["ICD_CODE", "DESCRIPTION"])
+    out = out.sort_values(["ICD_CODE", "DESCRIPTION"], kind="mergesort")
     return out[["ICD_CODE", "DESCRIPTION"]]
 
 
@@ -99,65 +127,61 @@ CABG_TEXT_RE = re.compile(
     re.I
 )
 
-def is_cabg_icd10pcs(code: str) -> bool:
-    c = (code or "").strip().upper()
-    return len(c) == 7 and c.isalnum() and c.startswith("021")
-
-def is_cabg_icd9proc(code: str) -> bool:
-    return nodot_upper(code).startswith("361")  # 36.1x
-
-def is_cabg_cpt(code: str) -> bool:
-    c = (code or "").strip()
-    if not c.isdigit():
-        return False
-    v = int(c)
-    return (33510 <= v <= 33523) or (33533 <= v <= 33536)
-
-def is_cabg_code(code: str) -> bool:
-    return is_cabg_icd10pcs(code) or is_cabg_icd9proc(code) or is_cabg_cpt(code)
+# CPT 33510–33523, 33533–33536 as a lookup table indexed by (code - CPT_LO)
+CPT_LO = 33510
+CPT_TBL = np.zeros(33536 - CPT_LO + 1, dtype=bool)
+CPT_TBL[np.r_[0:14, 23:27]] = True
+
+def cabg_code_mask(codes: pd.Series) -> pd.Series:
+    # codes are already stripped/uppercased; one vectorized pass per code system
+    icd10pcs = (codes.str.len() == 7) & codes.str.isalnum() & codes.str.startswith("021")
+    icd9proc = codes.str.replace(r"[.\s]", "", regex=True).str.startswith("361")  # 36.1x
+    idx = pd.to_numeric(codes.where(codes.str.isdigit()), errors="coerce").to_numpy(dtype=float) - CPT_LO
+    in_tbl = (idx >= 0) & (idx < CPT_TBL.size)  # NaN compares False
+    cpt = np.zeros(len(codes), dtype=bool)
+    cpt[in_tbl] = CPT_TBL[idx[in_tbl].astype(np.intp)]
+    return icd10pcs | icd9proc | cpt
 
 def extract_cabg_from_treatment(treatment_csv: Path) -> pd.DataFrame:
     df = read_csv_any(treatment_csv)
     if df.empty:
         return pd.DataFrame(columns=["DESCRIPTION"])
 
-    code_col = pick_col(df, [
+    cols_lc = lower_colmap(df)
+    code_col = pick_col(cols_lc, [
         "icd_code","icd10pcs","icd10_code","icd9_code","proc_code","procedure_code",
         "operation_code","op_code","code","cpt","cpt_code"
     ])
-    desc_col = pick_col(df, [
+    desc_col = pick_col(cols_lc, [
         "procedure","procedure_name","proc_description","operation","op_name",
         "title","description","desc","long_title","short_title","name","label"
     ])
 
     w = pd.DataFrame(index=df.index)
     if code_col:
-        w["ICD_CODE"] = df[code_col].astype(str).str.strip().str.upper()
+        w["ICD_CODE"] = strip_upper(df[code_col])
     if desc_col:
-        w["DESCRIPTION"] = df[desc_col].astype(str).str.strip()
+        w["DESCRIPTION"] = df[desc_col].fillna("").astype(str).str.strip()
     else:
         w["DESCRIPTION"] = concat_text_fallback(df)
 
-    mask_text = w["DESCRIPTION"].str.contains(CABG_TEXT_RE, na=False)
-
     if "ICD_CODE" in w:
-        valid_code_mask = w["ICD_CODE"].map(is_cabg_code)
+        valid_code_mask = cabg_code_mask(w["ICD_CODE"])
         any_valid = bool(valid_code_mask.any())
 
         if any_valid:
             # strict two-column output; include only rows with valid codes
-            out = w.loc[valid_code_mask, ["ICD_CODE", "DESCRIPTION"]].drop_duplicates()
-            out = out.sort_values(["ICD_CODE", "DESCRIPTION"])
+            out = sorted_unique(w.loc[valid_code_mask, ["ICD_CODE", "DESCRIPTION"]], ["ICD_CODE", "DESCRIPTION"])
             return out[["ICD_CODE", "DESCRIPTION"]]
         else:
             # no valid ICD/CPT at all -> description-only per requirement
-            out = w.loc[mask_text, ["DESCRIPTION"]].drop_duplicates()
-            out = out.sort_values(["DESCRIPTION"])
+            mask_text = w["DESCRIPTION"].str.contains(CABG_TEXT_RE, na=False)
+            out = sorted_unique(w.loc[mask_text, ["DESCRIPTION"]], ["DESCRIPTION"])
             return out[["DESCRIPTION"]]
     else:
         # no code column -> description-only per requirement
-        out = w.loc[mask_text, ["DESCRIPTION"]].drop_duplicates()
-        out = out.sort_values(["DESCRIPTION"])
+        mask_text = w["DESCRIPTION"].str.contains(CABG_TEXT_RE, na=False)
+        out = sorted_unique(w.loc[mask_text, ["DESCRIPTION"]], ["DESCRIPTION"])
         return out[["DESCRIPTION"]]
 
 
@@ -173,8 +197,8 @@ if __name__ == "__main__":
     cabg = extract_cabg_from_treatment(TREATMENT)
 
     OUTDIR.mkdir(parents=True, exist_ok=True)
-    cad.to_csv(OUTDIR / "CAD_from_diagnosis.csv", index=False, encoding="utf-8")
-    cabg.to_csv(OUTDIR / "CABG_from_treatment.csv", index=False, encoding="utf-8")
+    pacsv.write_csv(pa.Table.from_pandas(cad, preserve_index=False), OUTDIR / "CAD_from_diagnosis.csv")
+    pacsv.write_csv(pa.Table.from_pandas(cabg, preserve_index=False), OUTDIR / "CABG_from_treatment.csv")
 
     print(f"[CAD] rows:  {len(cad)} -> {OUTDIR / 'CAD_from_diagnosis.csv'}")
     print(f"[CABG] rows: {len(cabg)} -> {OUTDIR / 'CABG_from_treatment.csv'}")
@@ -55,33 +55,46 @@ def pick_code_col(df: pd.DataFrame) -> str:
     raise KeyError(f"No ICD code column found. Available: {list(df.columns)}")
 
 # -------------------- Patterns (no capturing groups) --------------------
+# A plain string is one regex; a tuple is an AND of regexes that must all be
+# found in the title (replaces "A.*B" clauses, which backtrack on long text).
 CAD_PATTERNS = [
     r"\bcoronary artery disease\b",
     r"\bcoronary atheroscl",                              # coronary atherosclerosis
     r"\batherosclerotic heart disease\b",                 # ASHD
-    r"\bische?mic heart disease\b.*coronary",
+    (r"\bische?mic heart disease\b", r"coronary"),
     r"\bcoronary arter(?:ioscl|y)\b",
-    r"\bchronic ischemic heart disease\b.*coronary",
+    (r"\bchronic ischemic heart disease\b", r"coronary"),
     r"\batherosclerosis of (?:native )?coronary artery\b",
     r"\bCAD\b",
 ]
 
 CABG_PATTERNS = [
-    r"\baorto.?coronary.*bypass\b",
+    (r"\baorto.?coronary", r"bypass\b"),
     r"\bcoronary artery bypass\b",
-    r"\bbypass.*coronary artery\b",
+    (r"\bbypass", r"coronary artery\b"),
     r"\bCABG\b",
-    r"\bcoronary revascularization\b.*bypass",
+    (r"\bcoronary revascularization\b", r"bypass"),
 ]
 
-CAD_REGEX = [re.compile(p, re.I) for p in CAD_PATTERNS]
-CABG_REGEX = [re.compile(p, re.I) for p in CABG_PATTERNS]
+def compile_patterns(patterns):
+    """Union all single patterns into one regex; keep AND-clauses as tuples."""
+    single = [p for p in patterns if isinstance(p, str)]
+    clauses = [tuple(re.compile(q, re.I) for q in p) for p in patterns if not isinstance(p, str)]
+    if single:
+        clauses.insert(0, (re.compile("|".join(f"(?:{p})" for p in single), re.I),))
+    return clauses
 
-def any_regex_match(series: pd.Series, compiled_patterns) -> pd.Series:
+CAD_REGEX = compile_patterns(CAD_PATTERNS)
+CABG_REGEX = compile_patterns(CABG_PATTERNS)
+
+def any_regex_match(series: pd.Series, compiled_clauses) -> pd.Series:
     s = series.fillna("")
     mask = pd.Series(False, index=s.index)
-    for rx in compiled_patterns:
-        mask = mask | s.str.contains(rx, na=False)
+    for clause in compiled_clauses:
+        m = pd.Series(True, index=s.index)
+        for rx in clause:
+            m = m & s.str.contains(rx, na=False)
+        mask = mask | m
     return mask
 
 # -------------------- Core logic --------------------
@@ -90,11 +103,10 @@ def extract_cad(diag_csv: str) -> pd.DataFrame:
     d = normalize_cols(d)
     code_col = pick_code_col(d)
     desc_col = pick_desc_col(d)
-    m = any_regex_match(d[desc_col], CAD_REGEX)
-    out = (d.loc[m, [code_col, desc_col]]
-             .dropna()
-             .drop_duplicates()
-             .rename(columns={code_col: "ICD_CODE", desc_col: "DESCRIPTION"}))
+    # dedupe (code, title) pairs first so the regexes only see each title once
+    uniq = d[[code_col, desc_col]].dropna().drop_duplicates()
+    m = any_regex_match(uniq[desc_col], CAD_REGEX)
+    out = uniq.loc[m].rename(columns={code_col: "ICD_CODE", desc_col: "DESCRIPTION"})
     return out[["ICD_CODE", "DESCRIPTION"]].sort_values("ICD_CODE")
 
 def extract_cabg(proc_csv: str) -> pd.DataFrame:
@@ -102,11 +114,9 @@ def extract_cabg(proc_csv: str) -> pd.DataFrame:
     p = normalize_cols(p)
     code_col = pick_code_col(p)
     desc_col = pick_desc_col(p)
-    m = any_regex_match(p[desc_col], CABG_REGEX)
-    out = (p.loc[m, [code_col, desc_col]]
-             .dropna()
-             .drop_duplicates()
-             .rename(columns={code_col: "ICD_CODE", desc_col: "DESCRIPTION"}))
+    uniq = p[[code_col, desc_col]].dropna().drop_duplicates()
+    m = any_regex_match(uniq[desc_col], CABG_REGEX)
+    out = uniq.loc[m].rename(columns={code_col: "ICD_CODE", desc_col: "DESCRIPTION"})
     return out[["ICD_CODE", "DESCRIPTION"]].sort_values("ICD_CODE")
 
 def main():
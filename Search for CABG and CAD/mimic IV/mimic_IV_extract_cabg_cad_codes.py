@@ -27,11 +27,12 @@ from __future__ import annotations
 
 import argparse
 import logging
-import re
 from pathlib import Path
-from typing import Optional, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 
 # ------------------------------ I/O -------------------------------------------
@@ -70,77 +71,91 @@ def read_icd_table(path: Path) -> pd.DataFrame:
 
 # --------------------------- Normalization ------------------------------------
 
-def remove_dots_spaces(s: Optional[str]) -> str:
-    """Normalize code by removing dots and spaces, uppercase."""
-    return re.sub(r"[.\s]", "", (s or "")).upper()
+def remove_dots_spaces(codes: pd.Series) -> pd.Series:
+    """Normalize codes by removing dots and spaces, uppercase (whole column at once)."""
+    return codes.str.replace(r"[.\s]", "", regex=True).str.upper()
 
 
 # ----------------------------- Rules ------------------------------------------
+# Each rule takes the whole (stripped, uppercase) code column and returns a boolean mask.
 
-def is_icd10pcs_cabg(code: str) -> bool:
+def is_icd10pcs_cabg(codes: pd.Series) -> pd.Series:
     """
     CABG in ICD-10-PCS: exactly 7 characters, alphanumeric, starting with '021'.
+    The alphanumeric test runs on a (n, 7) code-point matrix of the candidates
+    instead of a per-string isalnum() call.
     """
-    c = (code or "").strip().upper()
-    return len(c) == 7 and c.startswith("021") and c.isalnum()
-
-
-def is_icd9proc_cabg(code_nodot: str) -> bool:
+    mask = np.zeros(len(codes), dtype=bool)
+    cand = ((codes.str.len() == 7) & codes.str.startswith("021")).to_numpy(dtype=bool)
+    if cand.any():
+        sub = codes[cand]
+        cp = sub.to_numpy(dtype="U7").view(np.uint32).reshape(-1, 7)
+        alnum = ((cp >= ord("0")) & (cp <= ord("9"))) | ((cp >= ord("A")) & (cp <= ord("Z"))) \
+            | ((cp >= ord("a")) & (cp <= ord("z")))
+        ok = alnum.all(axis=1)
+        # rare non-ASCII rows keep str.isalnum() semantics (e.g. accented letters count)
+        non_ascii = (cp > 127).any(axis=1)
+        if non_ascii.any():
+            ok[non_ascii] = sub[non_ascii].str.isalnum().to_numpy(dtype=bool)
+        mask[cand] = ok
+    return pd.Series(mask, index=codes.index)
+
+
+def is_icd9proc_cabg(codes_nodot: pd.Series) -> pd.Series:
     """
     CABG in ICD-9-CM procedures: 36.1x (stored without dot as 361*).
     """
-    return code_nodot.startswith("361")
+    return codes_nodot.str.startswith("361")
 
 
-def is_excluded_pcs_prefix(code: str) -> bool:
+def is_excluded_pcs_prefix(codes: pd.Series) -> pd.Series:
     """
     Explicitly exclude non-procedure imaging/fluoroscopy PCS prefixes (e.g., B21****).
     Extend this list if your source dictionary contains other non-procedure sections.
     """
-    c = (code or "").strip().upper()
-    return c.startswith("B21")
+    return codes.str.startswith("B21")
 
 
-def is_cad_diag(code: str, code_nodot: str) -> bool:
+# --------------------------- Extraction ---------------------------------------
+
+def distinct_sorted(df: pd.DataFrame) -> pd.DataFrame:
     """
-    CAD in diagnoses:
-      - ICD-10-CM: I25.*
-      - ICD-9-CM : 414.*
+    Distinct (icd_code, description) pairs sorted by code, in one Arrow hash-group + sort.
+    Rows sharing a code are ordered by description, so the output order is deterministic.
     """
-    return code.upper().startswith("I25") or code_nodot.startswith("414")
+    t = pa.Table.from_pandas(df, preserve_index=False)
+    t = t.group_by(["icd_code", "description"]).aggregate([])
+    return t.sort_by([("icd_code", "ascending"), ("description", "ascending")]).to_pandas()
 
 
-# --------------------------- Extraction ---------------------------------------
-
 def extract_cabg(proc_df: pd.DataFrame) -> pd.DataFrame:
     """Return two-column CABG list from procedures dictionary."""
-    tmp = proc_df.copy()
-    tmp["_code_nodot"] = tmp["icd_code"].map(remove_dots_spaces)
-
+    codes = proc_df["icd_code"]
     mask = (
-        tmp["icd_code"].map(is_icd10pcs_cabg)
-        | tmp["_code_nodot"].map(is_icd9proc_cabg)
-    ) & ~tmp["icd_code"].map(is_excluded_pcs_prefix)
+        is_icd10pcs_cabg(codes)
+        | is_icd9proc_cabg(remove_dots_spaces(codes))
+    ) & ~is_excluded_pcs_prefix(codes)
 
     out = (
-        tmp.loc[mask, ["icd_code", "description"]]
-            .drop_duplicates()
-            .sort_values("icd_code")
+        proc_df.loc[mask, ["icd_code", "description"]]
+            .pipe(distinct_sorted)
             .rename(columns={"icd_code": "ICD_CODE", "description": "DESCRIPTION"})
     )
     return out
 
 
 def extract_cad(diag_df: pd.DataFrame) -> pd.DataFrame:
-    """Return two-column CAD list from diagnoses dictionary."""
-    tmp = diag_df.copy()
-    tmp["_code_nodot"] = tmp["icd_code"].map(remove_dots_spaces)
-
-    mask = tmp.apply(lambda r: is_cad_diag(r["icd_code"], r["_code_nodot"]), axis=1)
+    """
+    Return two-column CAD list from diagnoses dictionary.
+    CAD in diagnoses:
+      - ICD-10-CM: I25.*
+      - ICD-9-CM : 414.*
+    """
+    codes = diag_df["icd_code"]
+    mask = codes.str.startswith("I25") | remove_dots_spaces(codes).str.startswith("414")
     out = (
-        tmp.loc[mask, ["icd_code", "description"]]
-            .drop_duplicates()
-            .sort_values("icd_code")
+        diag_df.loc[mask, ["icd_code", "description"]]
+            .pipe(distinct_sorted)
             .rename(columns={"icd_code": "ICD_CODE", "description": "DESCRIPTION"})
     )
     return out
@@ -152,13 +167,17 @@ def extract_cabg_status(diag_df: pd.DataFrame) -> pd.DataFrame:
     mask = diag_df["icd_code"].isin(cabg_status_set)
     out = (
         diag_df.loc[mask, ["icd_code", "description"]]
-            .drop_duplicates()
-            .sort_values("icd_code")
+            .pipe(distinct_sorted)
             .rename(columns={"icd_code": "ICD_CODE", "description": "DESCRIPTION"})
     )
     return out
 
 
+def write_csv(df: pd.DataFrame, path: Path) -> None:
+    """Write a code list as UTF-8 CSV through Arrow's writer (strings quoted consistently)."""
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
 # ----------------------------- CLI / Main -------------------------------------
 
 def parse_args() -> argparse.Namespace:
@@ -204,9 +223,9 @@ def main() -> None:
     cad_path = args.outdir / "cad_icd.csv"
     cabg_status_path = args.outdir / "cabg_status_icd.csv"
 
-    cabg_out.to_csv(cabg_path, index=False, encoding="utf-8")
-    cad_out.to_csv(cad_path, index=False, encoding="utf-8")
-    cabg_status_out.to_csv(cabg_status_path, index=False, encoding="utf-8")
+    write_csv(cabg_out, cabg_path)
+    write_csv(cad_out, cad_path)
+    write_csv(cabg_status_out, cabg_status_path)
 
     logging.info("Done.")
     logging.info("CABG codes: %d -> %s", len(cabg_out), cabg_path)